@@ -0,0 +1 @@
+# benchmarks of the catalog building and validation code, run with: python -m benchmarks.run --help
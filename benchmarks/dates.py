@@ -0,0 +1,145 @@
+"""
+Checks that datajsonvalidator.is_date_value accepts exactly the values of the "modified", "temporal" and "issued"
+fields that its regexes do when all of them are tried, on a corpus of hand picked and random values, and times both:
+
+    python -m benchmarks.dates
+    python -m benchmarks.dates --size 1000000 --seed 1
+
+Exits with status 1, listing them, if any verdicts differ.
+"""
+import argparse
+import random
+import sys
+import timeit
+
+from ckanext.datajson import datajsonvalidator
+from ckanext.datajson.datajsonvalidator import is_date_value
+
+REGEXES = {
+    'modified': ('MODIFIED_REGEX_1', 'MODIFIED_REGEX_2', 'MODIFIED_REGEX_3'),
+    'temporal': ('TEMPORAL_REGEX_1', 'TEMPORAL_REGEX_2', 'TEMPORAL_REGEX_3'),
+    'issued': ('ISSUED_REGEX',),
+}
+
+CORPUS = (
+    # dates and times
+    '2010', '+2010', '-2010', '20101', '201001', '2010-01', '2010-1', '2010-13', '2010-00', '20100101', '2010-01-01',
+    '2010-0101', '201001-01', '2010-01-32', '2010-02-30', '2010-W01', '2010W01', '2010-W53', '2010-W00', '2010-W01-1',
+    '2010-W011', '2010W017', '2010-W01-8', '2010-001', '2010001', '2010-360', '2010-361', '2010-366', '2010-367',
+    '2010-000', '2010-01-01T', '2010-01-01 ', '2010-01-01\n', '2010-01-01\t12:00', '2010-01-01T12', '2010-01-01T24',
+    '2010-01-01T2400', '2010-01-01T24:00', '2010-01-01T24:00:00', '2010-01-01T12:00', '2010-01-01T1200',
+    '2010-01-01T12:0', '2010-01-01T12:60', '2010-01-01T12:00:00', '2010-01-01T120000', '2010-01-01T12:0000',
+    '2010-01-01T1200:00', '2010-01-01T12:00:60', '2010-01-01T12:00:00.5', '2010-01-01T12:00:00,5',
+    '2010-01-01T12:00:00.', '2010-01-01T12.5', '2010-01-01T12:30.5', '2010-01-01T12:30.5:00', '2010-01-01T12.55:',
+    '2010-01-01T12.5:', '2010-01-01TZ', '2010-01-01T12Z', '2010-01-01T12:00:00z', '2010-01-01T12:00:00+10',
+    '2010-01-01T12:00:00+10:00', '2010-01-01T12:00:00+1000', '2010-01-01T12:00:00+10:', '2010-01-01T12:00:00-24:00',
+    '2010-01-01T12:00:00+10:60', '2010-01-01T12:00:00.000Z', '2010-01-01t12:00:00', '2010-01-01T12:00:00ZZ',
+    '2010-01-01T12:00:00 +10:00', '2010-01-01 12:00:00', '2010-01-01\n\n', ' 2010-01-01', '2010-01-01/', '',
+    '10-01-01', '2010/01/01', '01/01/2010', 'last week', 'Jan 2010', u'2010-01-01', u'\u0662010-01-01',
+    u'2010-01-01T12:00\xa0',
+    # durations
+    'P', 'PT', 'P1Y', 'P1.5Y', 'P1.Y', 'P.5Y', 'P1Y2M3W4DT5H6M7S', 'P1M1Y', 'P1D1D', 'PT1H', 'PT1D', 'P1DT',
+    'P1H', 'P1YT1M', 'P1y', 'R/P1Y', 'R5/P1Y', 'R/P', 'R/', 'R', 'R5P1Y', 'RR/P1Y', 'R/P1Y\n', 'R/PT1H30M', 'p1Y',
+    # intervals
+    '2010-01-01/2012-12-31', '2010/2012', '2010-01/2012-12', '2010-01-01/2012', '2010/2012-12-31', '2010-01/2012-1231',
+    '20100101/20121231', '20100101/2012-12-31', '2010-01-01/20121231', '2010-01-01/2012-12', '2010-W01/2010-W52',
+    '2010-001/2010-365', '2010-01-01T00:00:00Z/2010-12-31T23:59:59Z', '2010-01-01T00:00/2010-12-31T23:59:59',
+    '2010-01-01T0000/2010-12-31T23:59:59', '2010-01-01T00/2010-12-31T23:59:59', '2010-01-01T0000/2010-12-31T235959',
+    '2010-01-01/P1Y', '2010-01-01T00:00:00Z/P1Y', 'R/2010-01-01/P1Y', 'R12/2010-01-01/P1M', 'P1Y/2010-01-01',
+    'R/P1Y/2010-01-01', 'P1Y/P1Y', '2010-01-01/2010-01-01/2010-01-01', '2010-01-01/', '/2010-01-01', '/',
+    '2010-01-01 / 2012-12-31', '2010-01-01/2012-12-31\n', '2010-01-01/2012-12-31 ', 'R/2010-01-01/2012-12-31',
+)
+
+# the pieces random values are made of, and the characters slipped into them
+DATES = ('2010', '+2010', '2010-01', '201001', '2010-13', '20100101', '2010-01-01', '2010-0101', '2010-1-1',
+         '2010-W01', '2010W011', '2010-W53', '2010-001', '2010-360', '2010-366')
+TIMES = ('', 'T', ' ', 'T12', 'T24', 'T24:00', 'T2400', 'T12:30', 'T1230', 'T12:30:00', 'T123000', 'T12:3000',
+         'T12:30:60', 'T12:30:00.5', 'T12:30:00,123', 'T12.5', 'T12:30.5')
+ZONES = ('', 'Z', 'z', '+10', '-10:00', '+1000', '+10:', '+24')
+DURATIONS = ('P', 'PT', 'P1Y', 'P1.5Y', 'P1Y2M3W4D', 'P1DT12H', 'PT1H30M15.5S', 'P1M1Y', 'PT1D', 'P1.Y')
+REPEATS = ('', '', 'R/', 'R5/', 'R')
+CHARACTERS = '0123456789-+:.,/ TWZPRYMDHS\n'
+
+
+def random_value(rng):
+    def date():
+        return rng.choice(DATES) + rng.choice(TIMES) + rng.choice(ZONES)
+
+    shape = rng.randint(0, 5)
+    if shape == 0:
+        value = date()
+    elif shape == 1:
+        value = rng.choice(REPEATS) + rng.choice(DURATIONS)
+    elif shape == 2:
+        value = date() + '/' + date()
+    elif shape == 3:
+        value = rng.choice(REPEATS) + date() + '/' + rng.choice(DURATIONS)
+    elif shape == 4:
+        value = rng.choice(REPEATS) + rng.choice(DURATIONS) + '/' + date()
+    else:
+        value = ''.join(rng.choice(CHARACTERS) for i in range(rng.randint(1, 12)))
+    for i in range(rng.choice((0, 0, 1, 2))):
+        position = rng.randint(0, len(value))
+        change = rng.randint(0, 2)
+        if change == 0:
+            value = value[:position] + rng.choice(CHARACTERS) + value[position:]
+        elif change == 1:
+            value = value[:position] + value[position + 1:]
+        else:
+            value = value[:position] + rng.choice(CHARACTERS) + value[position + 1:]
+    return value
+
+
+def matches(field_name, value):
+    # what the validator did before is_date_value: try each of the field's regexes in turn
+    return any(getattr(datajsonvalidator, name).match(value) for name in REGEXES[field_name])
+
+
+def forget():
+    for verdicts in datajsonvalidator._date_verdicts.values():
+        verdicts.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--size', type=int, default=100000, help='how many random values to add to the corpus')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random values')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    values = list(CORPUS) + [random_value(rng) for i in range(args.size)]
+
+    differences = []
+    accepted = dict((field_name, 0) for field_name in REGEXES)
+    for field_name in REGEXES:
+        for value in values:
+            expected = matches(field_name, value)
+            forget()
+            if is_date_value(field_name, value) != expected:
+                differences.append((field_name, value, expected))
+            accepted[field_name] += expected
+    print '%d values, accepted as modified/temporal/issued: %d/%d/%d' % (
+        len(values), accepted['modified'], accepted['temporal'], accepted['issued'])
+
+    # what catalogs hold: a few distinct values, used over and over
+    repeated = [rng.choice(values[:len(CORPUS)]) for i in range(len(values))]
+    print '%-10s %14s %14s %14s' % ('field', 'regexes us', 'first use us', 'repeated us')
+    for field_name in REGEXES:
+        timings = []
+        for function, corpus in ((matches, values), (is_date_value, values), (is_date_value, repeated)):
+            forget()
+            started = timeit.default_timer()
+            for value in corpus:
+                function(field_name, value)
+            timings.append((timeit.default_timer() - started) * 1e6 / len(corpus))
+        print '%-10s %14.2f %14.2f %14.2f' % ((field_name,) + tuple(timings))
+
+    for field_name, value, expected in differences:
+        print '%s %r: %s by the regexes, %s by is_date_value' % (
+            field_name, value, 'accepted' if expected else 'rejected', 'rejected' if expected else 'accepted')
+    if differences:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
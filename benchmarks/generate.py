@@ -0,0 +1,283 @@
+import hashlib
+import random
+
+# made up, but shaped like what the catalog holds: words for titles, tags and descriptions, a few organizations with
+# up to five levels of sub-organizations, and resources in the usual formats
+WORDS = (
+    'air', 'annual', 'atlas', 'boundaries', 'budget', 'census', 'climate', 'coastal', 'community', 'crime',
+    'dataset', 'education', 'election', 'emissions', 'employment', 'energy', 'environment', 'estimates', 'farm',
+    'forest', 'geology', 'grants', 'health', 'hospital', 'housing', 'imports', 'income', 'indicators', 'land',
+    'licences', 'locations', 'marine', 'measures', 'monthly', 'network', 'occupations', 'parks', 'permits',
+    'population', 'programs', 'quality', 'rainfall', 'regional', 'register', 'roads', 'schools', 'services',
+    'spending', 'statistics', 'survey', 'tenders', 'traffic', 'transport', 'trends', 'urban', 'vehicles', 'water',
+    'weather', 'wildlife', 'workforce',
+)
+
+PUBLISHERS = (
+    ('Department of Health', 'Health Services Division', 'Population Health Branch', 'Surveillance Section',
+     'Communicable Diseases Unit', 'Reporting Team'),
+    ('Department of Finance', 'Budget Group', 'Budget Policy Division', 'Data Management Branch',
+     'Publishing Section', 'Open Data Team'),
+    ('Department of Infrastructure', 'Transport Division', 'Roads Branch', 'Traffic Data Section',
+     'Counting Programme', 'Sensors Team'),
+    ('Bureau of Statistics', 'Census Division', 'Geography Branch', 'Boundaries Section', 'Mesh Blocks Unit',
+     'Release Team'),
+)
+
+BUREAU_CODES = ('009:10', '009:20', '009:25', '009:38')
+
+FORMATS = (
+    # format, mediaType, resource_type
+    ('CSV', 'text/csv', 'file'),
+    ('JSON', 'application/json', 'file'),
+    ('PDF', 'application/pdf', 'file'),
+    ('XLSX', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'file'),
+    ('ZIP', 'application/zip', 'file'),
+    ('API', None, 'api'),
+)
+
+FREQUENCIES = (
+    ('annual', 'R/P1Y'), ('monthly', 'R/P1M'), ('quarterly', 'R/P3M'), ('weekly', 'R/P1W'), ('daily', 'R/P1D'),
+    ('irregular', 'irregular'),
+)
+
+LICENSE = 'http://creativecommons.org/licenses/by/3.0/au/'
+
+
+class Generator(object):
+    """
+    Makes synthetic CKAN package dicts (as package_show returns them) and data.json entries. The dataset at each
+    index is always the same for a given seed, and can be made without making the ones before it. About invalid_ratio
+    of them have a problem: a required field missing or a malformed value.
+    """
+
+    def __init__(self, seed=0, invalid_ratio=0.05):
+        self.seed = seed
+        self.invalid_ratio = invalid_ratio
+
+    def uuid(self, *parts):
+        digest = hashlib.md5(':'.join(str(part) for part in (self.seed,) + parts)).hexdigest()
+        return '%s-%s-%s-%s-%s' % (digest[:8], digest[8:12], digest[12:16], digest[16:20], digest[20:])
+
+    def unique_id(self, index):
+        return self.uuid('unique_id', index)
+
+    def name(self, index):
+        return 'benchmark-dataset-%d' % index
+
+    def dataset(self, index):
+        """
+        Returns the made up values of the dataset at index, from which package and entry build their dicts.
+        """
+        rng = random.Random(self.seed * 1000003 + index)
+        words = rng.sample(WORDS, rng.randint(3, 8))
+        organization = rng.randrange(len(PUBLISHERS))
+        year = rng.randint(1995, 2016)
+        frequency = rng.choice(FREQUENCIES)
+        formats = [rng.choice(FORMATS) for i in range(min(int(rng.expovariate(1 / 6.0)), 80))]
+        resources = []
+        for i, (format, media_type, resource_type) in enumerate(formats):
+            resources.append({
+                'id': self.uuid('resource', index, i),
+                'name': '%s (%s)' % (' '.join(rng.sample(words, 2)).capitalize(), format),
+                'url': 'https://data.example.gov/dataset/%d/resource/%d/download' % (index, i),
+                'format': format,
+                'media_type': media_type,
+                'resource_type': resource_type,
+                'notes': ' '.join(rng.choice(WORDS) for j in range(rng.randint(0, 30))),
+            })
+        return {
+            'index': index,
+            'rng': rng,
+            'title': ' '.join(words).capitalize(),
+            'description': html_description(rng),
+            'tags': rng.sample(WORDS, rng.randint(1, 12)),
+            'organization': organization,
+            'publisher': PUBLISHERS[organization][:rng.randint(1, 6)],
+            'access_level': rng.choice(('public',) * 8 + ('restricted public', 'non-public')),
+            'bureau_codes': rng.sample(BUREAU_CODES, rng.randint(1, 2)),
+            'program_codes': ['009:%03d' % rng.randint(0, 999)],
+            'modified': '%d-%02d-%02dT%02d:%02d:00Z' % (year, rng.randint(1, 12), rng.randint(1, 28),
+                                                       rng.randint(0, 23), rng.randint(0, 59)),
+            'issued': '%d-%02d-%02d' % (year, rng.randint(1, 12), rng.randint(1, 28)),
+            'temporal': '%d-01-01/%d-12-31' % (year - rng.randint(0, 20), year),
+            'frequency': frequency,
+            'spatial': '%.4f,%.4f,%.4f,%.4f' % (144 + rng.random(), -38 + rng.random(), 145 + rng.random(),
+                                                -37 + rng.random()) if rng.random() < 0.5 else None,
+            'parent': rng.randrange(index) if index and rng.random() < 0.1 else None,
+            'resources': resources,
+            'invalid': rng.random() < self.invalid_ratio,
+        }
+
+    def package(self, index):
+        """
+        Returns the CKAN package dict of the dataset at index.
+        """
+        dataset = self.dataset(index)
+        rng = dataset['rng']
+        extras = {
+            'unique_id': self.unique_id(index),
+            'public_access_level': dataset['access_level'],
+            'contact_name': 'Data Officer %d' % rng.randint(1, 50),
+            'contact_email': 'data.officer%d@example.gov' % rng.randint(1, 50),
+            'bureau_code': ','.join(dataset['bureau_codes']),
+            'program_code': ','.join(dataset['program_codes']),
+            'modified': dataset['modified'],
+            'release_date': dataset['issued'],
+            'temporal': dataset['temporal'],
+            'accrual_periodicity': dataset['frequency'][0],
+            'language': 'en-US',
+            'category': ','.join(dataset['tags'][:3]),
+            'license_new': LICENSE,
+            'homepage_url': 'https://www.example.gov/%s' % self.name(index),
+            'data_quality': rng.choice(('on', 'true', 'false', '')),
+            'access_level_comment': 'Contact the data officer.' if dataset['access_level'] != 'public' else '',
+        }
+        extras['publisher'] = dataset['publisher'][0]
+        for level, name in enumerate(dataset['publisher'][1:]):
+            extras['publisher_%d' % (level + 1)] = name
+        if rng.random() < 0.3:
+            extras['related_documents'] = ','.join('https://www.example.gov/reports/%d' % rng.randint(1, 9999)
+                                                   for i in range(rng.randint(1, 4)))
+        if rng.random() < 0.2:
+            extras['data_dictionary'] = 'https://www.example.gov/dictionary/%d.csv' % index
+            extras['data_dictionary_type'] = 'text/csv'
+        if dataset['parent'] is not None:
+            extras['parent_dataset'] = self.name(dataset['parent'])
+        if dataset['invalid']:
+            # a required field left empty or missing
+            del extras[rng.choice(('contact_email', 'publisher', 'modified', 'bureau_code'))]
+
+        package = {
+            'id': self.uuid('package', index),
+            'name': self.name(index),
+            'title': dataset['title'],
+            'notes': dataset['description'],
+            'owner_org': self.uuid('organization', dataset['organization']),
+            'private': False,
+            'state': 'active',
+            'type': 'dataset',
+            'metadata_modified': dataset['modified'].rstrip('Z'),
+            'tags': [{'name': tag, 'display_name': tag} for tag in dataset['tags']],
+            'extras': [{'key': key, 'value': value} for key, value in sorted(extras.items())],
+            'resources': [],
+        }
+        if dataset['spatial']:
+            package['spatial'] = dataset['spatial']
+        for resource in dataset['resources']:
+            package['resources'].append({
+                'id': resource['id'],
+                'name': resource['name'],
+                'url': resource['url'],
+                # CKAN holds the format as typed in; make_datajson_entry turns the common ones into media types
+                'format': resource['format'].lower() if resource['format'] in ('CSV', 'JSON', 'PDF')
+                else resource['media_type'] or resource['format'],
+                'formatReadable': resource['format'],
+                'resource_type': resource['resource_type'],
+                'notes': resource['notes'],
+            })
+        return package
+
+    def entry(self, index):
+        """
+        Returns the data.json entry of the dataset at index, as a harvester would fetch it.
+        """
+        dataset = self.dataset(index)
+        rng = dataset['rng']
+        publisher = None
+        for name in reversed(dataset['publisher']):
+            publisher = dict([('@type', 'org:Organization'), ('name', name)] +
+                             ([('subOrganizationOf', publisher)] if publisher else []))
+        entry = {
+            '@type': 'dcat:Dataset',
+            'title': dataset['title'],
+            'description': dataset['description'],
+            'keyword': dataset['tags'],
+            'modified': dataset['modified'],
+            'publisher': publisher,
+            'contactPoint': {
+                '@type': 'vcard:Contact',
+                'fn': 'Data Officer %d' % rng.randint(1, 50),
+                'hasEmail': 'mailto:data.officer%d@example.gov' % rng.randint(1, 50),
+            },
+            'identifier': self.unique_id(index),
+            'accessLevel': dataset['access_level'],
+            'bureauCode': dataset['bureau_codes'],
+            'programCode': dataset['program_codes'],
+            'license': LICENSE,
+            'issued': dataset['issued'],
+            'temporal': dataset['temporal'],
+            'accrualPeriodicity': dataset['frequency'][1],
+            'language': ['en-US'],
+            'theme': dataset['tags'][:3],
+            'landingPage': 'https://www.example.gov/%s' % self.name(index),
+            'distribution': [],
+        }
+        if dataset['access_level'] != 'public':
+            entry['rights'] = 'Contact the data officer.'
+        if dataset['spatial']:
+            entry['spatial'] = dataset['spatial']
+        if dataset['parent'] is not None:
+            entry['isPartOf'] = self.unique_id(dataset['parent'])
+        for resource in dataset['resources']:
+            distribution = {
+                '@type': 'dcat:Distribution',
+                'title': resource['name'],
+                'format': resource['format'],
+            }
+            if resource['notes']:
+                distribution['description'] = resource['notes']
+            if resource['media_type']:
+                distribution['downloadURL'] = resource['url']
+                distribution['mediaType'] = resource['media_type']
+            else:
+                distribution['accessURL'] = resource['url']
+            entry['distribution'].append(distribution)
+        if not entry['distribution']:
+            del entry['distribution']
+        if dataset['invalid']:
+            problem = rng.choice(('contactPoint', 'modified', 'bureauCode', 'distribution'))
+            if problem == 'contactPoint':
+                del entry['contactPoint']
+            elif problem == 'modified':
+                entry['modified'] = 'last %s' % rng.choice(('week', 'month', 'year'))
+            elif problem == 'bureauCode':
+                entry['bureauCode'] = ['9-10']
+            else:
+                entry.setdefault('distribution', []).append({'@type': 'dcat:Distribution', 'downloadURL': 'data.csv',
+                                                             'mediaType': 'csv'})
+        return entry
+
+
+class ParentIdentifiers(object):
+    """
+    Stands in for the dict of parent dataset identifiers of loader.load_all_parent_identifiers, for the packages of
+    a Generator, without holding them all.
+    """
+
+    def __init__(self, generator):
+        self.generator = generator
+
+    def get(self, ref, default=None):
+        prefix = self.generator.name(0)[:-1]
+        if ref and ref.startswith(prefix):
+            return self.generator.unique_id(int(ref[len(prefix):]))
+        return default
+
+
+def html_description(rng):
+    """
+    Returns a description with the markup found in CKAN notes and harvested descriptions: paragraphs, lists, links,
+    emphasis and entities.
+    """
+    parts = []
+    for i in range(rng.randint(1, 5)):
+        sentence = ' '.join(rng.choice(WORDS) for j in range(rng.randint(8, 40)))
+        if rng.random() < 0.3:
+            sentence += ' <a href="https://www.example.gov/%s">%s</a>' % (rng.choice(WORDS), rng.choice(WORDS))
+        if rng.random() < 0.3:
+            sentence += ' <strong>%s</strong> &amp; <em>%s</em>' % (rng.choice(WORDS), rng.choice(WORDS))
+        parts.append('<p>%s.</p>' % sentence.capitalize())
+        if rng.random() < 0.3:
+            parts.append('<ul>%s</ul>' % ''.join('<li>%s</li>' % rng.choice(WORDS) for j in range(rng.randint(2, 6))))
+    return '\n'.join(parts)
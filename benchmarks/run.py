@@ -0,0 +1,171 @@
+"""
+Times the catalog building and validation functions on synthetic datasets (see generate.py), without a database or
+network, and reports their throughput and the memory they took. Each function and size runs in a process of its own:
+
+    python -m benchmarks.run
+    python -m benchmarks.run --sizes 1000,10000,100000 do_validation is_valid
+
+The ckanext.datajson package and its dependencies (CKAN included) must be importable.
+"""
+import argparse
+import logging
+import multiprocessing
+import Queue
+import resource
+import sys
+import timeit
+import traceback
+
+try:
+    from collections import OrderedDict  # 2.7
+except ImportError:
+    from sqlalchemy.util import OrderedDict
+
+from generate import Generator, ParentIdentifiers
+
+# inputs are made this many at a time, outside of the timed loop, so they don't count towards the time and only a
+# batch of them at a time counts towards the memory
+BATCH_SIZE = 100
+
+
+def bench_make_datajson_entry(generator):
+    from ckanext.datajson.build_datajson import make_datajson_entry
+    parent_identifiers = ParentIdentifiers(generator)
+    return make_datajson_entry, lambda index: (generator.package(index), parent_identifiers, [])
+
+
+def bench_generate_distribution(generator):
+    from ckanext.datajson.build_datajson import generate_distribution
+    return generate_distribution, lambda index: (generator.package(index),)
+
+
+def bench_get_publisher_tree(generator):
+    from ckanext.datajson.build_datajson import get_publisher_tree
+
+    def publisher_extras(index):
+        extras = dict((extra['key'], extra['value']) for extra in generator.package(index)['extras'])
+        extras.setdefault('publisher', 'Department of Health')
+        return extras,
+
+    return get_publisher_tree, publisher_extras
+
+
+def bench_do_validation(generator):
+    from ckanext.datajson.datajsonvalidator import do_validation
+    return do_validation, lambda index: ([generator.entry(index)], [])
+
+
+def bench_is_valid(generator):
+    from ckanext.datajson.plugin import is_valid
+    return is_valid, lambda index: (generator.entry(index),)
+
+
+def bench_parse_datajson_entry(generator):
+    from ckanext.datajson.parse_datajson import parse_datajson_entry
+    defaults = {'jurisdiction': 'Commonwealth', 'harvest_portal': 'Benchmark'}
+    return parse_datajson_entry, lambda index: (generator.entry(index), {}, defaults)
+
+
+def bench_html2text(generator):
+    # the copy of html2text that ships with the extension, which the harvester uses
+    from ckanext.datajson import html2text
+    return html2text.html2text, lambda index: (generator.dataset(index)['description'],)
+
+
+BENCHMARKS = OrderedDict([
+    ('make_datajson_entry', bench_make_datajson_entry),
+    ('generate_distribution', bench_generate_distribution),
+    ('get_publisher_tree', bench_get_publisher_tree),
+    ('do_validation', bench_do_validation),
+    ('is_valid', bench_is_valid),
+    ('parse_datajson_entry', bench_parse_datajson_entry),
+    ('html2text', bench_html2text),
+])
+
+
+def peak_memory():
+    # in kilobytes on Linux, bytes on OS X
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure(name, size, seed, results):
+    # puts (figures, None) on results, or (None, the traceback) if the benchmark fails
+    try:
+        function, make_args = BENCHMARKS[name](Generator(seed))
+        # the first call pays for imports and caches that every later call shares
+        function(*make_args(0))
+        memory_before = peak_memory()
+        elapsed = 0.0
+        for start in range(0, size, BATCH_SIZE):
+            batch = [make_args(index) for index in range(start, min(start + BATCH_SIZE, size))]
+            started = timeit.default_timer()
+            for args in batch:
+                function(*args)
+            elapsed += timeit.default_timer() - started
+        results.put(((elapsed, peak_memory(), peak_memory() - memory_before), None))
+    except Exception:
+        results.put((None, traceback.format_exc()))
+
+
+def run(name, size, seed):
+    """
+    Runs a benchmark in a new process. Returns the seconds its calls took, and the peak memory of the process and how
+    much of it was taken while the benchmark ran. Raises RuntimeError if the benchmark fails or its process dies.
+    """
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=measure, args=(name, size, seed, results))
+    process.start()
+    while True:
+        try:
+            result, error = results.get(timeout=1)
+            break
+        except Queue.Empty:
+            if not process.is_alive():
+                # whatever the process put on the queue before it exited is readable by now
+                try:
+                    result, error = results.get_nowait()
+                except Queue.Empty:
+                    result, error = None, 'the process exited with status %s' % process.exitcode
+                break
+    process.join()
+    if error:
+        raise RuntimeError(error)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('names', nargs='*', metavar='benchmark',
+                        help='the benchmarks to run: %s (all of them by default)' % ', '.join(BENCHMARKS))
+    parser.add_argument('--sizes', default='1000,10000,100000',
+                        help='comma separated numbers of datasets to run each benchmark on')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic datasets')
+    args = parser.parse_args()
+    for name in args.names:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark: %s' % name)
+
+    # invalid datasets are logged by the functions under test, which would drown the report
+    logging.basicConfig(level=logging.ERROR)
+
+    print '%-22s %8s %10s %12s %10s %12s %12s' % ('benchmark', 'size', 'seconds', 'per second', 'us each',
+                                                  'peak MB', 'growth MB')
+    failed = False
+    for name in args.names or BENCHMARKS:
+        for size in [int(size) for size in args.sizes.split(',')]:
+            try:
+                elapsed, peak, growth = run(name, size, args.seed)
+            except RuntimeError as error:
+                print '%-22s %8d failed:' % (name, size)
+                print '    ' + str(error).strip().replace('\n', '\n    ')
+                failed = True
+                continue
+            print '%-22s %8d %10.3f %12.0f %10.1f %12.1f %12.1f' % (
+                name, size, elapsed, size / elapsed if elapsed else 0, elapsed * 1e6 / size, peak / 1024.0,
+                growth / 1024.0)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Checks that the compiled schema validator (validation.fast_validator) gives the same verdict as jsonschema on a
+corpus of synthetic data.json entries (see generate.py), each mutated in a few random places, and times both:
+
+    python -m benchmarks.schema
+    python -m benchmarks.schema --size 100000 --seed 1
+
+Exits with status 1, listing them, if any verdicts differ.
+"""
+import argparse
+import copy
+import json
+import random
+import sys
+import timeit
+
+from ckanext.datajson.validation import fast_validator, validator
+
+from generate import Generator
+
+# what mutated fields are set to: values of every JSON type, and strings that are (or nearly are) what the schema's
+# enums, patterns and formats ask for
+VALUES = (
+    None, True, False, 0, 1, 1.5, -1, '', ' ', 'x', u'\xe9', 'a' * 300,
+    'http://www.example.gov/data.csv', 'not a uri', 'mailto:', 'mailto:someone@example.gov', 'someone@example.gov',
+    '015:11', '015:001', '9-10', 'R/P1Y', 'irregular', 'text/csv', 'csv', 'dcat:Dataset', 'dcat:Distribution',
+    'org:Organization', 'vcard:Contact', 'public', 'restricted public', 'non-public', 'secret', 'en-US', 'english',
+    '2014-01-01', '2014-13-01', 'last week', '2010-01-01/2011-01-01', '023-000000001', '023-1',
+    [], ['x'], ['x', 'x'], [1], [None], [{}], {}, {'name': 'x'}, {'fn': 'x', 'hasEmail': 'mailto:a@b.gov'},
+    [{'downloadURL': 'http://www.example.gov/a.csv'}],
+    [{'downloadURL': 'http://www.example.gov/a.csv', 'mediaType': 'text/csv'}],
+    [{'accessURL': 'http://www.example.gov/api', 'format': 'API'}],
+)
+
+# fields that the generator leaves out, but the schema describes
+EXTRA_FIELDS = ('rights', 'spatial', 'isPartOf', 'dataQuality', 'describedBy', 'describedByType', 'conformsTo',
+                'primaryITInvestmentUII', 'references', 'systemOfRecords', 'landingPage', 'unknownField')
+
+
+def paths(value, prefix=()):
+    # the path of every value nested in value, including its own
+    yield prefix
+    if isinstance(value, dict):
+        for key, item in value.items():
+            for path in paths(item, prefix + (key,)):
+                yield path
+    elif isinstance(value, list):
+        for index, item in enumerate(value):
+            for path in paths(item, prefix + (index,)):
+                yield path
+
+
+def mutate(entry, rng):
+    """
+    Returns a copy of entry with up to three values removed, replaced or added, anywhere in it.
+    """
+    entry = copy.deepcopy(entry)
+    for i in range(rng.randint(0, 3)):
+        path = rng.choice(list(paths(entry))[1:])
+        parent = entry
+        for key in path[:-1]:
+            parent = parent[key]
+        change = rng.random()
+        if change < 0.2:
+            del parent[path[-1]]
+        elif change < 0.3 and isinstance(parent, dict):
+            parent[rng.choice(EXTRA_FIELDS)] = copy.deepcopy(rng.choice(VALUES))
+        else:
+            parent[path[-1]] = copy.deepcopy(rng.choice(VALUES))
+    return entry
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--size', type=int, default=20000, help='how many entries to check')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the entries and their mutations')
+    args = parser.parse_args()
+
+    generator = Generator(args.seed)
+    rng = random.Random(args.seed)
+    entries = [mutate(generator.entry(index), rng) for index in range(args.size)]
+
+    differences = []
+    valid = 0
+    for entry in entries:
+        expected = validator.is_valid(entry)
+        valid += expected
+        if fast_validator(entry) != expected:
+            differences.append((entry, expected))
+    print '%d entries, %d valid' % (len(entries), valid)
+
+    print '%-12s %12s' % ('validator', 'us each')
+    for name, function in (('jsonschema', validator.is_valid), ('compiled', fast_validator)):
+        started = timeit.default_timer()
+        for entry in entries:
+            function(entry)
+        print '%-12s %12.1f' % (name, (timeit.default_timer() - started) * 1e6 / len(entries))
+
+    for entry, expected in differences:
+        print '%s by jsonschema, %s by the compiled validator: %s' % (
+            'valid' if expected else 'invalid', 'invalid' if expected else 'valid', json.dumps(entry))
+    if differences:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+import collections
+import itertools
+import logging
+import multiprocessing
+import time
+import urllib
+from contextlib import closing
+
+from datajsonvalidator import ErrorTable, add_duplicate_identifier, add_error, check_dataset, format_errors
+from jsonstream import NotACatalog, iter_datasets
+
+log = logging.getLogger('datajson')
+
+# how many datasets of a document are checked by a worker in one go
+CHUNK_SIZE = 200
+
+
+class SourceReport(object):
+    """
+    What is known so far about one of the documents being validated. Chunks of its datasets are checked apart, and
+    merged here in document order, so duplicate identifiers are found across chunks just like do_validation finds them.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.errs = ErrorTable(aggregate=True)
+        self.seen_identifiers = set()
+        self.datasets = 0
+        self.started = time.time()
+
+    def merge(self, errs, identifiers):
+        self.errs.merge(errs)
+        for identifier, dataset_name in identifiers:
+            if identifier in self.seen_identifiers:
+                add_duplicate_identifier(self.errs, identifier, dataset_name)
+            self.seen_identifiers.add(identifier)
+
+    def finish(self):
+        """
+        Returns the report on the document: its errors, grouped like the errors_array of do_validation.
+        """
+        errors_array = []
+        format_errors(self.errs, errors_array)
+        self.seen_identifiers = None
+        log.info("Validated %s: %d datasets, %d kinds of problems, in %.1fs", self.source, self.datasets,
+                 sum(len(messages) for heading, messages in errors_array), time.time() - self.started)
+        return {
+            'source': self.source,
+            'datasets': self.datasets,
+            'errors': errors_array,
+        }
+
+
+def validate_sources(sources, processes=None, chunk_size=CHUNK_SIZE):
+    """
+    Validates data.json documents, given as file names or http(s) URLs, with a pool of processes worker processes
+    (one per CPU by default, none if 1). Documents are read a chunk of datasets at a time (see jsonstream), and the
+    chunks of all of them are checked concurrently. Returns a report on each document, in the order given.
+    """
+    reports = [SourceReport(source) for source in sources]
+    tasks = iter_tasks(reports, chunk_size)
+    if processes == 1:
+        for index, start, datasets in tasks:
+            reports[index].merge(*check_chunk(start, datasets))
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            # only a few chunks are handed out ahead, so that documents are read no faster than they are checked
+            pending = collections.deque()
+            max_pending = 4 * (processes or multiprocessing.cpu_count())
+            for index, start, datasets in tasks:
+                pending.append((index, pool.apply_async(check_chunk, (start, datasets))))
+                while len(pending) >= max_pending:
+                    index, result = pending.popleft()
+                    reports[index].merge(*result.get())
+            while pending:
+                index, result = pending.popleft()
+                reports[index].merge(*result.get())
+        finally:
+            pool.terminate()
+            pool.join()
+    return [report.finish() for report in reports]
+
+
+def iter_tasks(reports, chunk_size):
+    # yields (report index, index of the first dataset, datasets) for the chunks of every document in turn, recording
+    # the documents that can't be read or aren't catalogs in their reports
+    for index, report in enumerate(reports):
+        try:
+            with open_source(report.source) as f:
+                datasets = iter_datasets(f)
+                while True:
+                    chunk, error = read_chunk(datasets, chunk_size)
+                    if chunk:
+                        yield index, report.datasets, chunk
+                        report.datasets += len(chunk)
+                    if error:
+                        # recorded once the datasets decoded before it have been handed out
+                        raise error
+                    if len(chunk) < chunk_size:
+                        break
+        except IOError as e:
+            add_error(report.errs, 0, "Error Loading File", "The address could not be loaded: " + unicode(e))
+        except NotACatalog as e:
+            add_error(report.errs, 0, "Bad JSON Structure", unicode(e))
+        except ValueError as e:
+            add_error(report.errs, 0, "Invalid JSON", "The file does not meet basic JSON syntax requirements: " +
+                      unicode(e) + ". Try using JSONLint.com.")
+        else:
+            if report.datasets == 0:
+                add_error(report.errs, 0, "Catalog Is Empty", "There are no entries in your file.")
+
+
+def read_chunk(datasets, chunk_size):
+    # returns the next chunk_size datasets (fewer at the end of the document), and the error that cut the chunk short,
+    # if reading or decoding the document failed
+    chunk = []
+    try:
+        for dataset in itertools.islice(datasets, chunk_size):
+            chunk.append(dataset)
+    except (IOError, ValueError) as e:
+        return chunk, e
+    return chunk, None
+
+
+def open_source(source):
+    if source.startswith('http://') or source.startswith('https://'):
+        return closing(urllib.urlopen(source))
+    return open(source, 'rb')
+
+
+def check_chunk(start, datasets):
+    """
+    Checks a chunk of datasets, starting at index start of their document. Returns the errors found, and the
+    identifiers (with the names their errors are reported under) of the datasets in the chunk that weren't already
+    used earlier in the chunk, for duplicates to be found across chunks.
+    """
+    errs = ErrorTable()
+    seen_identifiers = set()
+    identifiers = []
+    for i, item in enumerate(datasets):
+        seen = len(seen_identifiers)
+        try:
+            dataset_name = check_dataset(item, start + i, seen_identifiers, errs)
+        except Exception as e:
+            add_error(errs, 0, "Internal Error", "Something bad happened: " + unicode(e),
+                      "dataset %d" % (start + i + 1))
+            continue
+        if len(seen_identifiers) > seen:
+            identifiers.append((item["identifier"], dataset_name))
+    return errs, identifiers
@@ -3,6 +3,7 @@ try:
 except ImportError:
     from sqlalchemy.util import OrderedDict
 
+import json
 import logging
 import string
 
@@ -24,14 +25,58 @@ def make_datajson_catalog(datasets):
     return catalog
 
 
-def make_datajson_entry(package):
+def iter_datajson_catalog(datasets, chunk_size=64 * 1024, **dumps_kwargs):
+    """
+    Serializes the catalog built by make_datajson_catalog incrementally. Datasets are pulled from the given iterable
+    one at a time and written out as utf-8 encoded chunks of roughly chunk_size bytes, so the whole catalog never has
+    to be held in memory. Any extra keyword arguments are passed on to json.dumps.
+    """
+    fragments = (json.dumps(dataset, **dumps_kwargs) for dataset in datasets)
+    return iter_serialized_catalog(fragments, chunk_size, **dumps_kwargs)
+
+
+def iter_serialized_catalog(fragments, chunk_size=64 * 1024, **dumps_kwargs):
+    """
+    Like iter_datajson_catalog, but for datasets that have already been serialized to JSON strings.
+    """
+    # 'dataset' is the last key of the catalog, so its empty list can be cut off the end of the serialized wrapper
+    head = json.dumps(make_datajson_catalog([]), **dumps_kwargs)
+    buf = [head[:-2]]
+    size = len(buf[0])
+    separator = ''
+    for fragment in fragments:
+        piece = separator + fragment
+        separator = ', '
+        buf.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield encode_if_unicode(''.join(buf))
+            buf = []
+            size = 0
+    buf.append(']}')
+    yield encode_if_unicode(''.join(buf))
+
+
+def encode_if_unicode(val):
+    if isinstance(val, unicode):
+        val = val.encode('utf8')
+    return val
+
+
+def make_datajson_entry(package, parent_identifiers=None, errors=None):
+    # errors, if given, is a list the reason for returning no entry is appended to, as a (reason, message) pair,
+    # instead of being logged
     # extras is a list of dicts [{},{}, {}]. For each dict, extract the key, value entries into a new dict
     extras = dict([(x['key'], x['value']) for x in package['extras']])
 
+    # parent_identifiers, if given, maps parent datasets to their unique_id so they needn't be looked up here
     parent_dataset_id = extras.get('parent_dataset')
     if parent_dataset_id:
-        parent = model.Package.get(parent_dataset_id)
-        parent_uid = parent.extras.col.target['unique_id'].value
+        if parent_identifiers is not None:
+            parent_uid = parent_identifiers.get(parent_dataset_id)
+        else:
+            parent = model.Package.get(parent_dataset_id)
+            parent_uid = parent.extras.col.target['unique_id'].value
         if parent_uid:
             parent_dataset_id = parent_uid
 
@@ -130,8 +175,12 @@ def make_datajson_entry(package):
             split_multiple_entries(retlist, extras, pair)
 
     except KeyError as e:
-        log.warn("Invalid field detected for package with id=[%s], title=['%s']: '%s'", package.get('id'),
-                 package.get('title'), e)
+        message = u"Invalid field detected for package with id=[%s], title=['%s']: '%s'" % (package.get('id'),
+                                                                                            package.get('title'), e)
+        if errors is None:
+            log.warn(message)
+        else:
+            errors.append(('invalid_field', message))
         return
 
     # # TODO this is a lazy hack to make sure we don't have redundant fields when the free form key/value pairs are added
@@ -178,17 +227,7 @@ def make_datajson_entry(package):
             or striped_retlist_dict.get('dataQuality') == "False":
         striped_retlist_dict['dataQuality'] = False
 
-    from datajsonvalidator import do_validation
-    errors = []
-    try:
-        do_validation([dict(striped_retlist_dict)], errors)
-    except Exception as e:
-        errors.append(("Internal Error", ["Something bad happened: " + unicode(e)]))
-    if len(errors) > 0:
-        for error in errors:
-            log.warn(error)
-        return
-
+    # the entry is validated by the caller (see validation.validate_entry)
     return striped_retlist_dict
 
 
@@ -0,0 +1,394 @@
+import errno
+import fcntl
+import glob
+import itertools
+import logging
+import os
+import tempfile
+import threading
+import uuid
+import zlib
+
+import stats
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+log = logging.getLogger('datajson')
+
+# content codings stored alongside every cached payload, in order of preference
+ENCODINGS = ['br', 'gzip'] if brotli else ['gzip']
+ENCODING_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+
+class CachedPayload(object):
+    """
+    A rendered catalog held by the CatalogCache, either as byte strings in memory or as files on disk. Besides the
+    plain payload, a pre-compressed copy is kept for each of the ENCODINGS.
+    """
+
+    def __init__(self, name, version, bodies=None, paths=None, stale=False):
+        # bodies and paths map each encoding (None for the plain payload) to its bytes or file
+        self.name = name
+        self.version = version
+        self.bodies = bodies
+        self.paths = paths
+        # set when an older payload is handed out while a newer one is being built
+        self.stale = stale
+
+    def size(self, encoding=None):
+        if self.bodies is not None:
+            return len(self.bodies[encoding])
+        return os.path.getsize(self.paths[encoding])
+
+    def iter_chunks(self, encoding=None, chunk_size=64 * 1024):
+        if self.bodies is not None:
+            return iter([self.bodies[encoding]])
+        # open the file straight away so it can still be read if a newer version replaces it in the meantime
+        return iter_file(open(self.paths[encoding], 'rb'), chunk_size)
+
+
+def iter_file(f, chunk_size):
+    try:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        f.close()
+
+
+def write_file(path, chunks):
+    """
+    Writes the chunks to a temporary file next to path and renames it into place, so that readers never see a
+    partially written file.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.chmod(tmp_path, 0o644)
+        os.rename(tmp_path, path)
+    except:
+        os.remove(tmp_path)
+        raise
+
+
+class Encoder(object):
+    """
+    Incrementally compresses a payload for one of the ENCODINGS.
+    """
+
+    def __init__(self, encoding):
+        if encoding == 'gzip':
+            compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self.compress, self.flush = compressor.compress, compressor.flush
+        elif encoding == 'br':
+            compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=9)
+            self.compress, self.flush = compressor.process, compressor.finish
+        else:
+            raise ValueError('Unsupported encoding: %s' % encoding)
+
+
+def choose_encoding(accept_encoding, encodings=ENCODINGS):
+    """
+    Picks the content coding, out of the given ones, that an Accept-Encoding header rates highest. Returns None when
+    the payload should be sent as it is.
+    """
+    if not accept_encoding:
+        return None
+
+    qvalues = {}
+    for part in accept_encoding.split(','):
+        params = part.split(';')
+        coding = params[0].strip().lower()
+        qvalue = 1.0
+        for param in params[1:]:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    qvalue = float(value)
+                except ValueError:
+                    qvalue = 0.0
+        if coding:
+            qvalues[coding] = qvalue
+
+    best, best_qvalue = None, 0.0
+    for encoding in encodings:
+        qvalue = qvalues.get(encoding, qvalues.get('*', 0.0))
+        if qvalue > best_qvalue:
+            best, best_qvalue = encoding, qvalue
+    return best
+
+
+class CatalogCache(object):
+    """
+    Keeps materialised copies of the rendered catalogs until they are invalidated.
+
+    Payloads are kept in memory, or as files in cache_dir when one is given. Every payload is tagged with the
+    generation it was built under; invalidate() starts a new generation, for the whole cache or for a single name,
+    and anything built under an older one is rebuilt on its next use. With a cache directory the generations are
+    kept as stamp files next to the payloads, so an invalidation made by one process (a web worker or the harvester)
+    is seen by all of the others on the host.
+
+    Rebuilds are single-flight: while one thread (and with a cache directory, one process on the host) builds a
+    payload, other requests for it are given the previous payload, or wait for the new one if there is none.
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self._build_locks = {}
+        self._generations = {}
+        self._payloads = {}
+        if cache_dir and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def invalidate(self, name=None):
+        """
+        Marks the payload stored under name as out of date, or every payload if no name is given.
+        """
+        generation = uuid.uuid4().hex
+        with self._lock:
+            if self.cache_dir:
+                write_file(self._stamp_path(name), [generation])
+            else:
+                self._generations[name] = generation
+
+    def version(self, name):
+        """
+        Returns a string identifying the current generation of the payload stored under name.
+        """
+        return '%s-%s' % (self._generation(None), self._generation(name))
+
+    def fetch(self, name, build, version=None, encodings=ENCODINGS):
+        """
+        Returns the CachedPayload stored under name, first rendering it with build() if it is missing or out of date.
+        build must return an iterable of byte strings. A version string can be given to tie the payload to something
+        besides the cache's own generations (a digest of its packages, say), and encodings lists the pre-compressed
+        copies to keep; pass an empty list for payloads that are compressed already. If the payload is being rebuilt
+        elsewhere, the previous one is returned with its stale flag set.
+        """
+        # take the version before building, so an invalidation made while building forces another rebuild
+        version = self.version(name) + ('-' + version if version else '')
+
+        payload = self._current(name, version, encodings)
+        if payload is not None:
+            return payload
+
+        lock = self._build_lock(name)
+        if not lock.acquire(False):
+            payload = self._previous(name, encodings)
+            if payload is not None:
+                return payload
+            lock.acquire()
+        try:
+            if self.cache_dir:
+                return self._fetch_file(name, build, version, encodings)
+
+            payload = self._current(name, version, encodings)
+            if payload is None:
+                body = ''.join(build())
+                bodies = {None: body}
+                for encoding in encodings:
+                    encoder = Encoder(encoding)
+                    bodies[encoding] = encoder.compress(body) + encoder.flush()
+                payload = CachedPayload(name, version, bodies=bodies)
+                self._payloads[name] = payload
+            return payload
+        finally:
+            lock.release()
+
+    def _fetch_file(self, name, build, version, encodings):
+        # Other processes on the host are kept out with an exclusive lock on a file next to the payloads. The lock is
+        # released when the file is closed, even if the process dies.
+        with open(self._lock_path(name), 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError as e:
+                if e.errno not in (errno.EAGAIN, errno.EACCES):
+                    raise
+                payload = self._previous(name, encodings)
+                if payload is not None:
+                    return payload
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            # the process that held the lock may have just built this very version
+            payload = self._current(name, version, encodings)
+            if payload is None:
+                paths = self._encoding_paths(self._payload_path(name, version), encodings)
+                self._write_payload(build(), paths)
+                self._remove_stale(name, paths[None])
+                payload = CachedPayload(name, version, paths=paths)
+            return payload
+
+    def _current(self, name, version, encodings):
+        if not self.cache_dir:
+            payload = self._payloads.get(name)
+            if payload is not None and payload.version == version:
+                return payload
+            return None
+
+        path = self._payload_path(name, version)
+        if os.path.exists(path):
+            return CachedPayload(name, version, paths=self._encoding_paths(path, encodings))
+        return None
+
+    def _previous(self, name, encodings):
+        # the most recently built payload stored under name, whatever its version
+        if not self.cache_dir:
+            payload = self._payloads.get(name)
+            if payload is None:
+                return None
+            return CachedPayload(name, payload.version, bodies=payload.bodies, stale=True)
+
+        for path in self._stored_paths(name):
+            paths = self._encoding_paths(path, encodings)
+            if all(os.path.exists(encoded) for encoded in paths.values()):
+                version = os.path.basename(path)[len(name) + 1:]
+                return CachedPayload(name, version, paths=paths, stale=True)
+        return None
+
+    def _encoding_paths(self, path, encodings):
+        paths = dict((encoding, path + ENCODING_SUFFIXES[encoding]) for encoding in encodings)
+        paths[None] = path
+        return paths
+
+    def _build_lock(self, name):
+        with self._lock:
+            return self._build_locks.setdefault(name, threading.Lock())
+
+    def _write_payload(self, chunks, paths):
+        # Every encoding is written to its own temporary file in a single pass over the chunks. The plain payload is
+        # renamed into place last, so once it exists all of the encoded copies do too.
+        encoders = dict((encoding, Encoder(encoding)) for encoding in paths if encoding)
+        tmp_paths = {}
+        files = {}
+        try:
+            for encoding in paths:
+                fd, tmp_paths[encoding] = tempfile.mkstemp(dir=self.cache_dir, prefix='.tmp-')
+                files[encoding] = os.fdopen(fd, 'wb')
+            for chunk in chunks:
+                files[None].write(chunk)
+                for encoding, encoder in encoders.items():
+                    files[encoding].write(encoder.compress(chunk))
+            for encoding, encoder in encoders.items():
+                files[encoding].write(encoder.flush())
+            for f in files.values():
+                f.close()
+            for encoding in encoders.keys() + [None]:
+                os.rename(tmp_paths[encoding], paths[encoding])
+        except:
+            for encoding, tmp_path in tmp_paths.items():
+                if encoding in files:
+                    files[encoding].close()
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            raise
+
+    def _generation(self, name):
+        if not self.cache_dir:
+            return self._generations.get(name, '0')
+        try:
+            with open(self._stamp_path(name), 'r') as f:
+                return f.read().strip() or '0'
+        except IOError:
+            return '0'
+
+    def _stamp_path(self, name):
+        return os.path.join(self.cache_dir, '.generation-%s' % name if name else '.generation')
+
+    def _payload_path(self, name, version):
+        return os.path.join(self.cache_dir, '%s.%s' % (name, version))
+
+    def _lock_path(self, name):
+        return os.path.join(self.cache_dir, '.lock-%s' % name)
+
+    def _stored_paths(self, name):
+        # the plain payloads stored under name, newest first
+        suffixes = tuple(ENCODING_SUFFIXES.values())
+        paths = []
+        for path in glob.glob(self._payload_path(name, '*')):
+            if not path.endswith(suffixes):
+                try:
+                    paths.append((os.path.getmtime(path), path))
+                except OSError:
+                    pass
+        return [path for mtime, path in sorted(paths, reverse=True)]
+
+    def _remove_stale(self, name, current_path):
+        # Keep the payload built before the current one, as it may still be handed out while another process rebuilds
+        # or be in the middle of being sent. Anything older goes.
+        previous = [path for path in self._stored_paths(name) if path != current_path][:1]
+        for path in glob.glob(self._payload_path(name, '*')):
+            if not path.startswith(current_path) and not any(path.startswith(kept) for kept in previous):
+                try:
+                    os.remove(path)
+                except OSError:
+                    log.debug("Unable to remove stale cached catalog %s", path)
+
+
+class EntryCache(object):
+    """
+    Remembers the serialized data.json entry rendered for each package, keyed on the package id, its
+    metadata_modified timestamp and the identifier of its parent dataset (which its entry embeds as isPartOf, and which
+    changes without the child being modified), so rebuilding the catalog only renders the packages that changed since
+    the last build.
+    """
+
+    def __init__(self):
+        self._entries = {}
+
+    def render(self, packages, render_many, parent_identifiers=None, chunk_size=500):
+        """
+        Yields the serialized entry of each package in turn. Packages are taken chunk_size at a time, and those that
+        have no entry for their current metadata_modified and parent identifier (looked up in parent_identifiers, see
+        loader.load_all_parent_identifiers) yet are passed to render_many(packages, reasons) as a list, which must
+        return their serialized entries in the same order, with None for packages left out of the catalog, and append
+        the reason each package was left out for to reasons (see PackageRenderer.render_many). The reason is kept with
+        the entry, so that a package left out again without being rendered is counted as omitted in the build active on
+        this thread (see stats.BuildStats), as it would have been if it was rendered. Once all packages have been seen,
+        entries for packages that are gone are dropped.
+        """
+        parent_identifiers = parent_identifiers or {}
+        entries = {}
+        packages = iter(packages)
+        while True:
+            chunk = list(itertools.islice(packages, chunk_size))
+            if not chunk:
+                break
+
+            keys = dict((pkg['id'], entry_key(pkg, parent_identifiers)) for pkg in chunk)
+            stale = [pkg for pkg in chunk if not self._is_current(pkg['id'], keys[pkg['id']])]
+            reasons = []
+            rendered = dict(zip([pkg['id'] for pkg in stale], zip(render_many(stale, reasons), reasons)))
+            build = stats.current()
+
+            for pkg in chunk:
+                if pkg['id'] in rendered:
+                    fragment, reason = rendered[pkg['id']]
+                else:
+                    fragment, reason = self._entries[pkg['id']][1:]
+                    if fragment is None and build:
+                        build.omit(reason)
+                entries[pkg['id']] = (keys[pkg['id']], fragment, reason)
+                if fragment is not None:
+                    yield fragment
+        self._entries = entries
+
+    def _is_current(self, pkg_id, key):
+        cached = self._entries.get(pkg_id)
+        return cached is not None and cached[0] == key
+
+
+def entry_key(pkg, parent_identifiers):
+    # what a package's cached entry depends on besides its id
+    parent = None
+    for extra in pkg['extras']:
+        if extra['key'] == 'parent_dataset' and extra['value']:
+            parent = parent_identifiers.get(extra['value'])
+    return pkg.get('metadata_modified'), parent
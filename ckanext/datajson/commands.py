@@ -0,0 +1,109 @@
+import json
+import logging
+import os
+import sys
+
+from ckan.lib.cli import CkanCommand
+
+log = logging.getLogger('datajson')
+
+
+class DataJsonCommand(CkanCommand):
+    '''
+    Builds the /data.json catalog files outside of the web server
+
+    Usage:
+
+      datajson export <directory>
+        - Writes data.json, plus the Public Data Listing (pdl.zip) and
+          Enterprise Data Inventory (edi.zip) of every organization under
+          <directory>/organization/<organization id>/. Each file is written
+          to a temporary file first and renamed into place, so a web server
+          or CDN can serve the directory while it is being refreshed.
+
+      datajson validate [--processes=N] [--output=<report.json>] <file or URL> ...
+        - Validates data.json documents, several at a time and each with a
+          pool of worker processes (one per CPU unless --processes is
+          given), and writes a JSON report on each of them to <report.json>,
+          or to standard output. Needs no CKAN configuration.
+
+      datajson refresh-bureau-codes
+        - Downloads the OMB bureau codes that bureauCode values are checked
+          against, replacing the snapshot shipped with the extension. Web
+          processes pick the new codes up when they restart.
+    '''
+    summary = __doc__.split('\n')[0]
+    usage = __doc__
+    max_args = None
+    min_args = 1
+
+    parser = CkanCommand.standard_parser(verbose=True)
+    parser.add_option('-c', '--config', dest='config', default='development.ini', help='Config file to use.')
+    parser.add_option('-p', '--processes', dest='processes', type='int', default=None,
+                      help='Number of worker processes to validate with.')
+    parser.add_option('-o', '--output', dest='output', default=None, help='File to write the validation report to.')
+
+    def command(self):
+        cmd = self.args[0]
+        if cmd == 'validate':
+            if len(self.args) < 2:
+                print self.usage
+                sys.exit(1)
+            self.validate(self.args[1:])
+            return
+
+        self._load_config()
+
+        if cmd == 'export':
+            if len(self.args) != 2:
+                print self.usage
+                sys.exit(1)
+            self.export(self.args[1])
+        elif cmd == 'refresh-bureau-codes':
+            self.refresh_bureau_codes()
+        else:
+            print 'Command %s not recognized' % cmd
+            sys.exit(1)
+
+    def export(self, dest):
+        import ckan.model as model
+        from ckanext.datajson.cache import write_file
+        from ckanext.datajson.plugin import make_json, iter_pdl_zip, iter_edi_zip, iter_datajson_catalog
+        from ckanext.datajson.stats import BuildStats
+
+        if not os.path.isdir(dest):
+            os.makedirs(dest)
+
+        log.info("Writing %s", os.path.join(dest, 'data.json'))
+        stats = BuildStats('data.json')
+        write_file(os.path.join(dest, 'data.json'), stats.output(iter_datajson_catalog(make_json(stats))))
+
+        organizations = model.Session.query(model.Group.id) \
+            .filter(model.Group.is_organization == True) \
+            .filter(model.Group.state == 'active') \
+            .order_by(model.Group.name).all()
+        for (org_id,) in organizations:
+            org_dir = os.path.join(dest, 'organization', org_id)
+            if not os.path.isdir(org_dir):
+                os.makedirs(org_dir)
+            for zip_name, iter_zip in (('pdl', iter_pdl_zip), ('edi', iter_edi_zip)):
+                log.info("Writing %s", os.path.join(org_dir, zip_name + '.zip'))
+                write_file(os.path.join(org_dir, zip_name + '.zip'), iter_zip(org_id))
+
+    def refresh_bureau_codes(self):
+        from ckanext.datajson.datajsonvalidator import BUREAU_CODES_PATH, BUREAU_CODES_URL, refresh_bureau_codes
+
+        log.info("Downloading %s", BUREAU_CODES_URL)
+        count = refresh_bureau_codes()
+        log.info("Wrote %d bureau codes to %s", count, BUREAU_CODES_PATH)
+
+    def validate(self, sources):
+        from ckanext.datajson.batchvalidator import validate_sources
+
+        reports = validate_sources(sources, self.options.processes)
+        output = json.dumps(reports, indent=2)
+        if self.options.output:
+            with open(self.options.output, 'w') as f:
+                f.write(output)
+        else:
+            print output
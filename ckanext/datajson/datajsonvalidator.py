@@ -1,4 +1,9 @@
+import csv
+import heapq
+import os
+import random
 import re
+import threading
 
 # from the iso8601 package, plus ^ and $ on the edges
 ISO8601_REGEX = re.compile(r"^([0-9]{4})(-([0-9]{1,2})(-([0-9]{1,2})"
@@ -54,6 +59,9 @@ ISSUED_REGEX = re.compile(
     r'\d+(?!:))?)?(\17[0-5]\d([\.,]\d+)?)?([zZ]|([\+-])([01]\d|2[0-3]):?([0-5]\d)?)?)?)?$'
 )
 
+# how many verdicts on the values of each date field are remembered before its cache starts over
+MAX_DATE_VERDICTS = 10000
+
 URL_REGEX = re.compile(
     r'^(?:http|ftp)s?://'  # http:// or https:// or ftp:// or ftps://
     r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+(?:[A-Z]{2,6}\.?|[A-Z0-9-]{2,}\.?)|'  # domain...
@@ -81,16 +89,70 @@ LANGUAGE_REGEX = re.compile(
     r'(art-lojban|cel-gaulish|no-bok|no-nyn|zh-guoyu|zh-hakka|zh-min|zh-min-nan|zh-xiang)))$'
 )
 
-# load the OMB bureau codes on first load of this module
-import urllib, csv
+BUREAU_CODES_URL = "https://project-open-data.cio.gov/data/omb_bureau_codes.csv"
+
+# a snapshot of the OMB bureau codes at BUREAU_CODES_URL, shipped with the extension so that validating needs no
+# network access; the first line records where and when it was taken (see refresh_bureau_codes)
+BUREAU_CODES_PATH = os.path.join(os.path.dirname(__file__), 'resources', 'omb_bureau_codes.csv')
+
+_bureau_codes = None
+
+
+def get_bureau_codes():
+    """
+    Returns the OMB bureau codes, as "agency code:bureau code" strings, read from the snapshot on first use.
+    """
+    global _bureau_codes
+    if _bureau_codes is None:
+        with open(BUREAU_CODES_PATH, 'rb') as f:
+            _bureau_codes = parse_bureau_codes(f.read())
+    return _bureau_codes
+
+
+def parse_bureau_codes(content):
+    rows = csv.reader([line for line in content.splitlines() if not line.startswith('#')])
+    header = next(rows)
+    agency, bureau = header.index("Agency Code"), header.index("Bureau Code")
+    return frozenset(row[agency] + ":" + row[bureau] for row in rows if row)
+
+
+def refresh_bureau_codes(url=BUREAU_CODES_URL, path=BUREAU_CODES_PATH):
+    """
+    Downloads the OMB bureau codes and replaces the snapshot at path with them. Returns how many codes there are.
+    """
+    import datetime
+    import requests
+    from cache import write_file
+
+    response = requests.get(url, timeout=60)
+    response.raise_for_status()
+    # fails on anything that isn't a list of bureau codes, leaving the snapshot as it was
+    codes = parse_bureau_codes(response.content)
+    if not codes:
+        raise ValueError("No bureau codes found at %s" % url)
+    lines = ["# %s, snapshot of %s" % (url, datetime.date.today().isoformat())] + response.content.splitlines()
+    write_file(path, ['\n'.join(lines) + '\n'])
+
+    global _bureau_codes
+    _bureau_codes = None
+    return len(codes)
+
+
+# how much of the errors is kept when they are aggregated (see ErrorTable): different descriptions under a heading,
+# and sample locations of each
+MAX_DESCRIPTIONS = 500
+MAX_SAMPLES = 20
+
+# how much of the aggregated errors is reported: the most frequent descriptions under each heading, and examples of
+# their locations
+REPORTED_DESCRIPTIONS = 100
+REPORTED_EXAMPLES = 3
 
-omb_burueau_codes = set()
-for row in csv.DictReader(urllib.urlopen("https://project-open-data.cio.gov/data/omb_bureau_codes.csv")):
-    omb_burueau_codes.add(row["Agency Code"] + ":" + row["Bureau Code"])
 
 # main function for validation
-def do_validation(doc, errors_array):
-    errs = {}
+def do_validation(doc, errors_array, aggregate=False):
+    # with aggregate, time and memory stay bounded however many of the datasets are broken, see ErrorTable
+    errs = ErrorTable(aggregate)
 
     if type(doc) != list:
         add_error(errs, 0, "Bad JSON Structure",
@@ -100,291 +162,469 @@ def do_validation(doc, errors_array):
         add_error(errs, 0, "Catalog Is Empty", "There are no entries in your file.")
     else:
         seen_identifiers = set()
-
         for i, item in enumerate(doc):
-            # Required
-
-            dataset_name = "dataset %d" % (i + 1)
-
-            # title
-            if check_string_field(item, "title", 1, dataset_name, errs):
-                dataset_name = '"%s"' % item.get("title", "").strip()
-
-            # accessLevel # required
-            if check_string_field(item, "accessLevel", 3, dataset_name, errs):
-                if item["accessLevel"] not in ("public", "restricted public", "non-public"):
-                    add_error(errs, 5, "Invalid Required Field Value",
-                              "The field 'accessLevel' had an invalid value: \"%s\"" % item["accessLevel"],
-                              dataset_name)
-
-            # bureauCode # required
-            if check_required_field(item, "bureauCode", list, dataset_name, errs):
-                for bc in item["bureauCode"]:
-                    if not isinstance(bc, (str, unicode)):
-                        add_error(errs, 5, "Invalid Required Field Value", "Each bureauCode must be a string",
-                                  dataset_name)
-                    elif ":" not in bc:
-                        add_error(errs, 5, "Invalid Required Field Value",
-                                  "The bureau code \"%s\" is invalid. "
-                                  "Start with the agency code, then a colon, then the bureau code." % bc,
-                                  dataset_name)
-                    elif bc not in omb_burueau_codes:
-                        add_error(errs, 5, "Invalid Required Field Value",
-                                  "The bureau code \"%s\" was not found in our list "
-                                  "(https://project-open-data.cio.gov/data/omb_bureau_codes.csv)." % bc, dataset_name)
-
-            # contactPoint # required
-            if check_required_field(item, "contactPoint", dict, dataset_name, errs):
-                cp = item["contactPoint"]
-                # contactPoint - fn # required
-                check_string_field(cp, "fn", 1, dataset_name, errs)
-
-                # contactPoint - hasEmail # required
-                if check_string_field(cp, "hasEmail", 9, dataset_name, errs):
-                    import lepl.apps.rfc3696
-
-                    email_validator = lepl.apps.rfc3696.Email()
-                    email = cp["hasEmail"].replace('mailto:', '')
-                    if not email_validator(email):
-                        add_error(errs, 5, "Invalid Required Field Value",
-                                  "The email address \"%s\" is not a valid email address." % email,
-                                  dataset_name)
-
-            # description # required
-            check_string_field(item, "description", 1, dataset_name, errs)
-
-            # identifier #required
-            if check_string_field(item, "identifier", 1, dataset_name, errs):
-                if item["identifier"] in seen_identifiers:
-                    add_error(errs, 5, "Invalid Required Field Value",
-                              "The dataset identifier \"%s\" is used more than once." % item["identifier"],
-                              dataset_name)
-                seen_identifiers.add(item["identifier"])
-
-            # keyword # required
-            if isinstance(item.get("keyword"), (str, unicode)):
-                add_error(errs, 5, "Update Your File!",
-                          "The keyword field used to be a string but now it must be an array.", dataset_name)
-            elif check_required_field(item, "keyword", list, dataset_name, errs):
-                for kw in item["keyword"]:
-                    if not isinstance(kw, (str, unicode)):
-                        add_error(errs, 5, "Invalid Required Field Value",
-                                  "Each keyword in the keyword array must be a string", dataset_name)
-                    elif len(kw.strip()) == 0:
-                        add_error(errs, 5, "Invalid Required Field Value",
-                                  "A keyword in the keyword array was an empty string.", dataset_name)
-
-            # modified # required
-            if check_string_field(item, "modified", 1, dataset_name, errs):
-                if not MODIFIED_REGEX_1.match(item['modified']) \
-                        and not MODIFIED_REGEX_2.match(item['modified']) \
-                        and not MODIFIED_REGEX_3.match(item['modified']):
-                    add_error(errs, 5, "Invalid Required Field Value",
-                              "The field \"modified\" is not in valid format: \"%s\"" % item['modified'], dataset_name)
-
-            # programCode # required
-            if check_required_field(item, "programCode", list, dataset_name, errs):
-                for pc in item["programCode"]:
-                    if not isinstance(pc, (str, unicode)):
-                        add_error(errs, 5, "Invalid Required Field Value",
-                                  "Each programCode in the programCode array must be a string", dataset_name)
-                    elif not PROGRAM_CODE_REGEX.match(pc):
-                        add_error(errs, 50, "Invalid Field Value (Optional Fields)",
-                                  "One of programCodes is not in valid format (ex. 018:001): \"%s\"" % pc, dataset_name)
-
-            # publisher # required
-            if check_required_field(item, "publisher", dict, dataset_name, errs):
-                # publisher - name # required
-                check_string_field(item["publisher"], "name", 1, dataset_name, errs)
-
-            # Required-If-Applicable
-
-            # dataQuality # Required-If-Applicable
-            if item.get("dataQuality") is None:
-                pass  # not required
-            elif not isinstance(item["dataQuality"], bool):
-                add_error(errs, 50, "Invalid Field Value (Optional Fields)",
-                          "The field 'dataQuality' must be true or false, "
-                          "as a JSON boolean literal (not the string \"true\" or \"false\").",
+            check_dataset(item, i, seen_identifiers, errs)
+
+    format_errors(errs, errors_array)
+
+
+def do_stream_validation(f, errors_array):
+    """
+    Validates the data.json document read from the file-like object f like do_validation, but one dataset at a time
+    as it is parsed (see jsonstream.iter_datasets), so the document is never held in memory. Apart from the dataset
+    being checked, only the identifiers seen so far and the aggregated errors (see ErrorTable) are kept. Returns the
+    number of datasets checked.
+    """
+    from jsonstream import NotACatalog, iter_datasets
+
+    errs = ErrorTable(aggregate=True)
+    seen_identifiers = set()
+    count = 0
+    datasets = iter_datasets(f)
+    while True:
+        # only the parser's errors end the stream; the datasets read before them are reported on as well
+        try:
+            item = next(datasets)
+        except StopIteration:
+            if count == 0:
+                add_error(errs, 0, "Catalog Is Empty", "There are no entries in your file.")
+            break
+        except NotACatalog as e:
+            add_error(errs, 0, "Bad JSON Structure", unicode(e))
+            break
+        except ValueError as e:
+            add_error(errs, 0, "Invalid JSON", "The file does not meet basic JSON syntax requirements: " +
+                      unicode(e) + ". Try using JSONLint.com.")
+            break
+
+        try:
+            check_dataset(item, count, seen_identifiers, errs)
+        except Exception as e:
+            add_error(errs, 0, "Internal Error", "Something bad happened: " + unicode(e), "dataset %d" % (count + 1))
+        count += 1
+
+    format_errors(errs, errors_array)
+    return count
+
+
+def check_dataset(item, i, seen_identifiers, errs):
+    # checks the dataset at index i of a document, adding its identifier to seen_identifiers, and returns the name its
+    # errors are reported under
+    dataset_name = "dataset %d" % (i + 1)
+    if not isinstance(item, dict):
+        add_error(errs, 0, "Bad JSON Structure", "Each dataset must be an object.", dataset_name)
+        return dataset_name
+
+    # Required
+
+    # title
+    if check_string_field(item, "title", 1, dataset_name, errs):
+        dataset_name = '"%s"' % item.get("title", "").strip()
+
+    # accessLevel # required
+    if check_string_field(item, "accessLevel", 3, dataset_name, errs):
+        if item["accessLevel"] not in ("public", "restricted public", "non-public"):
+            add_error(errs, 5, "Invalid Required Field Value",
+                      "The field 'accessLevel' had an invalid value: \"%s\"" % item["accessLevel"],
+                      dataset_name)
+
+    # bureauCode # required
+    if check_required_field(item, "bureauCode", list, dataset_name, errs):
+        for bc in item["bureauCode"]:
+            if not isinstance(bc, (str, unicode)):
+                add_error(errs, 5, "Invalid Required Field Value", "Each bureauCode must be a string",
+                          dataset_name)
+            elif ":" not in bc:
+                add_error(errs, 5, "Invalid Required Field Value",
+                          "The bureau code \"%s\" is invalid. "
+                          "Start with the agency code, then a colon, then the bureau code." % bc,
+                          dataset_name)
+            elif bc not in get_bureau_codes():
+                add_error(errs, 5, "Invalid Required Field Value",
+                          "The bureau code \"%s\" was not found in our list "
+                          "(%s)." % (bc, BUREAU_CODES_URL), dataset_name)
+
+    # contactPoint # required
+    if check_required_field(item, "contactPoint", dict, dataset_name, errs):
+        cp = item["contactPoint"]
+        # contactPoint - fn # required
+        check_string_field(cp, "fn", 1, dataset_name, errs)
+
+        # contactPoint - hasEmail # required
+        if check_string_field(cp, "hasEmail", 9, dataset_name, errs):
+            email = cp["hasEmail"].replace('mailto:', '')
+            if not get_email_validator()(email):
+                add_error(errs, 5, "Invalid Required Field Value",
+                          "The email address \"%s\" is not a valid email address." % email,
                           dataset_name)
 
-            # distribution # Required-If-Applicable
-            if item.get("distribution") is None:
-                pass  # not required
-            elif not isinstance(item["distribution"], list):
+    # description # required
+    check_string_field(item, "description", 1, dataset_name, errs)
+
+    # identifier #required
+    if check_string_field(item, "identifier", 1, dataset_name, errs):
+        if item["identifier"] in seen_identifiers:
+            add_duplicate_identifier(errs, item["identifier"], dataset_name)
+        seen_identifiers.add(item["identifier"])
+
+    # keyword # required
+    if isinstance(item.get("keyword"), (str, unicode)):
+        add_error(errs, 5, "Update Your File!",
+                  "The keyword field used to be a string but now it must be an array.", dataset_name)
+    elif check_required_field(item, "keyword", list, dataset_name, errs):
+        for kw in item["keyword"]:
+            if not isinstance(kw, (str, unicode)):
+                add_error(errs, 5, "Invalid Required Field Value",
+                          "Each keyword in the keyword array must be a string", dataset_name)
+            elif len(kw.strip()) == 0:
+                add_error(errs, 5, "Invalid Required Field Value",
+                          "A keyword in the keyword array was an empty string.", dataset_name)
+
+    # modified # required
+    if check_string_field(item, "modified", 1, dataset_name, errs):
+        if not is_date_value('modified', item['modified']):
+            add_error(errs, 5, "Invalid Required Field Value",
+                      "The field \"modified\" is not in valid format: \"%s\"" % item['modified'], dataset_name)
+
+    # programCode # required
+    if check_required_field(item, "programCode", list, dataset_name, errs):
+        for pc in item["programCode"]:
+            if not isinstance(pc, (str, unicode)):
+                add_error(errs, 5, "Invalid Required Field Value",
+                          "Each programCode in the programCode array must be a string", dataset_name)
+            elif not PROGRAM_CODE_REGEX.match(pc):
                 add_error(errs, 50, "Invalid Field Value (Optional Fields)",
-                          "The field 'distribution' must be an array, if present.", dataset_name)
-            else:
-                for j, dt in enumerate(item["distribution"]):
-                    distribution_name = dataset_name + (" distribution %d" % (j + 1))
-                    # distribution - downloadURL # Required-If-Applicable
-                    check_url_field(False, dt, "downloadURL", distribution_name, errs)
-
-                    # distribution - mediaType # Required-If-Applicable
-                    if 'downloadURL' in dt:
-                        if check_string_field(dt, "mediaType", 1, distribution_name, errs):
-                            if not IANA_MIME_REGEX.match(dt["mediaType"]):
-                                add_error(errs, 5, "Invalid Field Value",
-                                          "The distribution mediaType \"%s\" is invalid. "
-                                          "It must be in IANA MIME format." % dt["mediaType"],
-                                          distribution_name)
-
-                    # distribution - accessURL # optional
-                    check_url_field(False, dt, "accessURL", distribution_name, errs)
-
-                    # distribution - conformsTo # optional
-                    check_url_field(False, dt, "conformsTo", distribution_name, errs)
-
-                    # distribution - describedBy # optional
-                    check_url_field(False, dt, "describedBy", distribution_name, errs)
-
-                    # distribution - describedByType # optional
-                    if dt.get("describedByType") is None:
-                        pass  # not required
-                    elif not IANA_MIME_REGEX.match(dt["describedByType"]):
+                          "One of programCodes is not in valid format (ex. 018:001): \"%s\"" % pc, dataset_name)
+
+    # publisher # required
+    if check_required_field(item, "publisher", dict, dataset_name, errs):
+        # publisher - name # required
+        check_string_field(item["publisher"], "name", 1, dataset_name, errs)
+
+    # Required-If-Applicable
+
+    # dataQuality # Required-If-Applicable
+    if item.get("dataQuality") is None:
+        pass  # not required
+    elif not isinstance(item["dataQuality"], bool):
+        add_error(errs, 50, "Invalid Field Value (Optional Fields)",
+                  "The field 'dataQuality' must be true or false, "
+                  "as a JSON boolean literal (not the string \"true\" or \"false\").",
+                  dataset_name)
+
+    # distribution # Required-If-Applicable
+    if item.get("distribution") is None:
+        pass  # not required
+    elif not isinstance(item["distribution"], list):
+        add_error(errs, 50, "Invalid Field Value (Optional Fields)",
+                  "The field 'distribution' must be an array, if present.", dataset_name)
+    else:
+        for j, dt in enumerate(item["distribution"]):
+            distribution_name = dataset_name + (" distribution %d" % (j + 1))
+            # distribution - downloadURL # Required-If-Applicable
+            check_url_field(False, dt, "downloadURL", distribution_name, errs)
+
+            # distribution - mediaType # Required-If-Applicable
+            if 'downloadURL' in dt:
+                if check_string_field(dt, "mediaType", 1, distribution_name, errs):
+                    if not IANA_MIME_REGEX.match(dt["mediaType"]):
                         add_error(errs, 5, "Invalid Field Value",
-                                  "The describedByType \"%s\" is invalid. "
-                                  "It must be in IANA MIME format." % dt["describedByType"],
+                                  "The distribution mediaType \"%s\" is invalid. "
+                                  "It must be in IANA MIME format." % dt["mediaType"],
                                   distribution_name)
 
-                    # distribution - description # optional
-                    if dt.get("description") is not None:
-                        check_string_field(dt, "description", 1, distribution_name, errs)
-
-                    # distribution - format # optional
-                    if dt.get("format") is not None:
-                        check_string_field(dt, "format", 1, distribution_name, errs)
+            # distribution - accessURL # optional
+            check_url_field(False, dt, "accessURL", distribution_name, errs)
 
-                    # distribution - title # optional
-                    if dt.get("title") is not None:
-                        check_string_field(dt, "title", 1, distribution_name, errs)
+            # distribution - conformsTo # optional
+            check_url_field(False, dt, "conformsTo", distribution_name, errs)
 
-            # license # Required-If-Applicable
-            check_url_field(False, item, "license", dataset_name, errs)
+            # distribution - describedBy # optional
+            check_url_field(False, dt, "describedBy", distribution_name, errs)
 
-            # rights # Required-If-Applicable
-            # TODO move to warnings
-            # if item.get("accessLevel") != "public":
-            #     check_string_field(item, "rights", 1, dataset_name, errs)
+            # distribution - describedByType # optional
+            if dt.get("describedByType") is None:
+                pass  # not required
+            elif not IANA_MIME_REGEX.match(dt["describedByType"]):
+                add_error(errs, 5, "Invalid Field Value",
+                          "The describedByType \"%s\" is invalid. "
+                          "It must be in IANA MIME format." % dt["describedByType"],
+                          distribution_name)
+
+            # distribution - description # optional
+            if dt.get("description") is not None:
+                check_string_field(dt, "description", 1, distribution_name, errs)
+
+            # distribution - format # optional
+            if dt.get("format") is not None:
+                check_string_field(dt, "format", 1, distribution_name, errs)
+
+            # distribution - title # optional
+            if dt.get("title") is not None:
+                check_string_field(dt, "title", 1, distribution_name, errs)
+
+    # license # Required-If-Applicable
+    check_url_field(False, item, "license", dataset_name, errs)
+
+    # rights # Required-If-Applicable
+    # TODO move to warnings
+    # if item.get("accessLevel") != "public":
+    #     check_string_field(item, "rights", 1, dataset_name, errs)
+
+    # spatial # Required-If-Applicable
+    # TODO: There are more requirements than it be a string.
+    if item.get("spatial") is not None and not isinstance(item.get("spatial"), (str, unicode)):
+        add_error(errs, 50, "Invalid Field Value (Optional Fields)",
+                  "The field 'spatial' must be a string value if specified.", dataset_name)
+
+    # temporal # Required-If-Applicable
+    if item.get("temporal") is None:
+        pass  # not required
+    elif not isinstance(item["temporal"], (str, unicode)):
+        add_error(errs, 10, "Invalid Field Value (Optional Fields)",
+                  "The field 'temporal' must be a string value if specified.", dataset_name)
+    elif "/" not in item["temporal"]:
+        add_error(errs, 10, "Invalid Field Value (Optional Fields)",
+                  "The field 'temporal' must be two dates separated by a forward slash.", dataset_name)
+    elif not is_date_value('temporal', item['temporal']):
+        add_error(errs, 50, "Invalid Field Value (Optional Fields)",
+                  "The field 'temporal' has an invalid start or end date.", dataset_name)
+
+    # Expanded Fields
+
+    # accrualPeriodicity # optional
+    if item.get("accrualPeriodicity") not in ACCRUAL_PERIODICITY_VALUES:
+        add_error(errs, 50, "Invalid Field Value (Optional Fields)",
+                  "The field 'accrualPeriodicity' had an invalid value.", dataset_name)
+
+    # conformsTo # optional
+    check_url_field(False, item, "conformsTo", dataset_name, errs)
+
+    # describedBy # optional
+    check_url_field(False, item, "describedBy", dataset_name, errs)
+
+    # describedByType # optional
+    if item.get("describedByType") is None:
+        pass  # not required
+    elif not IANA_MIME_REGEX.match(item["describedByType"]):
+        add_error(errs, 5, "Invalid Field Value",
+                  "The describedByType \"%s\" is invalid. "
+                  "It must be in IANA MIME format." % item["describedByType"],
+                  dataset_name)
 
-            # spatial # Required-If-Applicable
-            # TODO: There are more requirements than it be a string.
-            if item.get("spatial") is not None and not isinstance(item.get("spatial"), (str, unicode)):
+    # isPartOf # optional
+    if item.get("isPartOf"):
+        check_string_field(item, "isPartOf", 1, dataset_name, errs)
+
+    # issued # optional
+    if item.get("issued") is not None:
+        if not is_date_value('issued', item['issued']):
+            add_error(errs, 50, "Invalid Field Value (Optional Fields)",
+                      "The field 'issued' is not in a valid format.", dataset_name)
+
+    # landingPage # optional
+    check_url_field(False, item, "landingPage", dataset_name, errs)
+
+    # language # optional
+    if item.get("language") is None:
+        pass  # not required
+    elif not isinstance(item["language"], list):
+        add_error(errs, 50, "Invalid Field Value (Optional Fields)",
+                  "The field 'language' must be an array, if present.", dataset_name)
+    else:
+        for s in item["language"]:
+            if not LANGUAGE_REGEX.match(s):
                 add_error(errs, 50, "Invalid Field Value (Optional Fields)",
-                          "The field 'spatial' must be a string value if specified.", dataset_name)
-
-            # temporal # Required-If-Applicable
-            if item.get("temporal") is None:
-                pass  # not required
-            elif not isinstance(item["temporal"], (str, unicode)):
-                add_error(errs, 10, "Invalid Field Value (Optional Fields)",
-                          "The field 'temporal' must be a string value if specified.", dataset_name)
-            elif "/" not in item["temporal"]:
-                add_error(errs, 10, "Invalid Field Value (Optional Fields)",
-                          "The field 'temporal' must be two dates separated by a forward slash.", dataset_name)
-            elif not TEMPORAL_REGEX_1.match(item['temporal']) \
-                    and not TEMPORAL_REGEX_2.match(item['temporal']) \
-                    and not TEMPORAL_REGEX_3.match(item['temporal']):
+                          "The field 'language' had an invalid language: \"%s\"" % s, dataset_name)
+
+    # PrimaryITInvestmentUII # optional
+    if item.get("PrimaryITInvestmentUII") is None:
+        pass  # not required
+    elif not PRIMARY_IT_INVESTMENT_UII_REGEX.match(item["PrimaryITInvestmentUII"]):
+        add_error(errs, 50, "Invalid Field Value (Optional Fields)",
+                  "The field 'PrimaryITInvestmentUII' must be a string "
+                  "in 023-000000001 format, if present.", dataset_name)
+
+    # references # optional
+    if item.get("references") is None:
+        pass  # not required
+    elif not isinstance(item["references"], list):
+        add_error(errs, 50, "Invalid Field Value (Optional Fields)",
+                  "The field 'references' must be an array, if present.", dataset_name)
+    else:
+        for s in item["references"]:
+            if not URL_REGEX.match(s):
                 add_error(errs, 50, "Invalid Field Value (Optional Fields)",
-                          "The field 'temporal' has an invalid start or end date.", dataset_name)
+                          "The field 'references' had an invalid URL: \"%s\"" % s, dataset_name)
 
-            # Expanded Fields
+    # systemOfRecords # optional
+    check_url_field(False, item, "systemOfRecords", dataset_name, errs)
 
-            # accrualPeriodicity # optional
-            if item.get("accrualPeriodicity") not in ACCRUAL_PERIODICITY_VALUES:
+    # theme #optional
+    if item.get("theme") is None:
+        pass  # not required
+    elif not isinstance(item["theme"], list):
+        add_error(errs, 50, "Invalid Field Value (Optional Fields)", "The field 'theme' must be an array.",
+                  dataset_name)
+    else:
+        for s in item["theme"]:
+            if not isinstance(s, (str, unicode)):
                 add_error(errs, 50, "Invalid Field Value (Optional Fields)",
-                          "The field 'accrualPeriodicity' had an invalid value.", dataset_name)
-
-            # conformsTo # optional
-            check_url_field(False, item, "conformsTo", dataset_name, errs)
-
-            # describedBy # optional
-            check_url_field(False, item, "describedBy", dataset_name, errs)
-
-            # describedByType # optional
-            if item.get("describedByType") is None:
-                pass  # not required
-            elif not IANA_MIME_REGEX.match(item["describedByType"]):
-                add_error(errs, 5, "Invalid Field Value",
-                          "The describedByType \"%s\" is invalid. "
-                          "It must be in IANA MIME format." % item["describedByType"],
-                          dataset_name)
+                          "Each value in the theme array must be a string", dataset_name)
+            elif len(s.strip()) == 0:
+                add_error(errs, 50, "Invalid Field Value (Optional Fields)",
+                          "A value in the theme array was an empty string.", dataset_name)
 
-            # isPartOf # optional
-            if item.get("isPartOf"):
-                check_string_field(item, "isPartOf", 1, dataset_name, errs)
+    return dataset_name
 
-            # issued # optional
-            if item.get("issued") is not None:
-                if not ISSUED_REGEX.match(item['issued']):
-                    add_error(errs, 50, "Invalid Field Value (Optional Fields)",
-                              "The field 'issued' is not in a valid format.", dataset_name)
 
-            # landingPage # optional
-            check_url_field(False, item, "landingPage", dataset_name, errs)
+_email_validators = threading.local()
 
-            # language # optional
-            if item.get("language") is None:
-                pass  # not required
-            elif not isinstance(item["language"], list):
-                add_error(errs, 50, "Invalid Field Value (Optional Fields)",
-                          "The field 'language' must be an array, if present.", dataset_name)
-            else:
-                for s in item["language"]:
-                    if not LANGUAGE_REGEX.match(s):
-                        add_error(errs, 50, "Invalid Field Value (Optional Fields)",
-                                  "The field 'language' had an invalid language: \"%s\"" % s, dataset_name)
 
-            # PrimaryITInvestmentUII # optional
-            if item.get("PrimaryITInvestmentUII") is None:
-                pass  # not required
-            elif not PRIMARY_IT_INVESTMENT_UII_REGEX.match(item["PrimaryITInvestmentUII"]):
-                add_error(errs, 50, "Invalid Field Value (Optional Fields)",
-                          "The field 'PrimaryITInvestmentUII' must be a string "
-                          "in 023-000000001 format, if present.", dataset_name)
+def get_email_validator():
+    # building lepl's email parser takes far longer than running it, so each thread builds one and keeps it
+    validator = getattr(_email_validators, 'validator', None)
+    if validator is None:
+        import lepl.apps.rfc3696
+        validator = _email_validators.validator = lepl.apps.rfc3696.Email()
+    return validator
 
-            # references # optional
-            if item.get("references") is None:
-                pass  # not required
-            elif not isinstance(item["references"], list):
-                add_error(errs, 50, "Invalid Field Value (Optional Fields)",
-                          "The field 'references' must be an array, if present.", dataset_name)
-            else:
-                for s in item["references"]:
-                    if not URL_REGEX.match(s):
-                        add_error(errs, 50, "Invalid Field Value (Optional Fields)",
-                                  "The field 'references' had an invalid URL: \"%s\"" % s, dataset_name)
 
-            # systemOfRecords # optional
-            check_url_field(False, item, "systemOfRecords", dataset_name, errs)
+def add_duplicate_identifier(errs, identifier, dataset_name):
+    add_error(errs, 5, "Invalid Required Field Value",
+              "The dataset identifier \"%s\" is used more than once." % identifier, dataset_name)
 
-            # theme #optional
-            if item.get("theme") is None:
-                pass  # not required
-            elif not isinstance(item["theme"], list):
-                add_error(errs, 50, "Invalid Field Value (Optional Fields)", "The field 'theme' must be an array.",
-                          dataset_name)
-            else:
-                for s in item["theme"]:
-                    if not isinstance(s, (str, unicode)):
-                        add_error(errs, 50, "Invalid Field Value (Optional Fields)",
-                                  "Each value in the theme array must be a string", dataset_name)
-                    elif len(s.strip()) == 0:
-                        add_error(errs, 50, "Invalid Field Value (Optional Fields)",
-                                  "A value in the theme array was an empty string.", dataset_name)
 
+def format_errors(errs, errors_array):
     # Form the output data.
     for err_type in sorted(errs):
+        descriptions = errs[err_type]
+        order = lambda x: (-len(descriptions[x]), x)
+        if errs.aggregate:
+            # only the most frequent descriptions are reported, so there's no need to sort them all
+            reported = heapq.nsmallest(REPORTED_DESCRIPTIONS, descriptions, key=order)
+        else:
+            reported = sorted(descriptions, key=order)
+        messages = [describe_error(err_item, descriptions[err_item], REPORTED_EXAMPLES if errs.aggregate else 0)
+                    for err_item in reported]
+        # problems found without a location count once
+        found = lambda err_items: sum(max(len(descriptions[err_item]), 1) for err_item in err_items)
+        unreported = errs.overflow.get(err_type, 0) + found(descriptions) - found(reported)
+        if unreported:
+            messages.append("... and %d more problems like these." % unreported)
         errors_array.append((
             err_type[1],  # heading
-            [err_item + (" (%d locations)" % len(errs[err_type][err_item]) if len(errs[err_type][err_item]) else "")
-             for err_item in sorted(errs[err_type], key=lambda x: (-len(errs[err_type][x]), x))
-            ]))
+            messages))
+
+
+def describe_error(description, locations, examples=0):
+    if not len(locations):
+        return description
+    if examples and locations.samples:
+        return description + " (%d locations, e.g. %s)" % (len(locations),
+                                                           ", ".join(sorted(locations.samples)[:examples]))
+    return description + " (%d locations)" % len(locations)
+
+
+class ErrorTable(dict):
+    """
+    The errors found in a document, as {(severity, heading): {description: Locations}}. With aggregate, time and
+    memory stay bounded however broken the document is: at most MAX_DESCRIPTIONS different descriptions are kept under
+    each heading (further ones are only counted, in overflow), each with a random sample of MAX_SAMPLES of its
+    locations, and only the REPORTED_DESCRIPTIONS most frequent ones are reported, with a few example locations.
+    """
+
+    def __init__(self, aggregate=False):
+        dict.__init__(self)
+        self.aggregate = aggregate
+        self.max_descriptions = MAX_DESCRIPTIONS if aggregate else None
+        self.max_samples = MAX_SAMPLES if aggregate else None
+        self.overflow = {}
+
+    def add(self, severity, heading, description, context=None):
+        err_type = (severity, heading)
+        descriptions = self.setdefault(err_type, {})
+        locations = descriptions.get(description)
+        if locations is None:
+            if self.max_descriptions is not None and len(descriptions) >= self.max_descriptions:
+                self.overflow[err_type] = self.overflow.get(err_type, 0) + 1
+                return
+            locations = descriptions[description] = Locations(self.max_samples)
+        if context:
+            locations.add(context)
+
+    def merge(self, other):
+        """
+        Adds the errors of another ErrorTable, such as one found in another part of the same document.
+        """
+        for (severity, heading), descriptions in other.items():
+            for description, locations in descriptions.items():
+                self.add(severity, heading, description)
+                merged = self[(severity, heading)].get(description)
+                if merged is None:
+                    # one description too many, counted in overflow
+                    self.overflow[(severity, heading)] += max(len(locations), 1) - 1
+                else:
+                    merged.merge(locations)
+        for err_type, count in other.overflow.items():
+            self.overflow[err_type] = self.overflow.get(err_type, 0) + count
+
+
+class Locations(object):
+    """
+    The datasets an error was found in: how many, and the names of some of them. Without max_samples, all the names
+    are kept and each dataset counts once. With it, a uniform random sample of max_samples names is kept (reservoir
+    sampling), and a dataset counts each time the error is found in it, unless it is in the sample.
+    """
+
+    def __init__(self, max_samples=None):
+        self.max_samples = max_samples
+        self.count = 0
+        self.samples = []
+        self._sampled = set()
+
+    def add(self, context):
+        if context in self._sampled:
+            return
+        self.count += 1
+        if self.max_samples is None or len(self.samples) < self.max_samples:
+            self.samples.append(context)
+            self._sampled.add(context)
+        else:
+            slot = random.randrange(self.count)
+            if slot < self.max_samples:
+                self._sampled.discard(self.samples[slot])
+                self.samples[slot] = context
+                self._sampled.add(context)
+
+    def merge(self, other):
+        if self.max_samples is None or len(self.samples) + len(other.samples) <= self.max_samples:
+            for context in other.samples:
+                self.add(context)
+            # locations that weren't kept can only be counted
+            self.count += other.count - len(other.samples)
+            return
+        # draw the new sample from both, in proportion to the number of locations each one stands for
+        mine, theirs = random.sample(self.samples, len(self.samples)), random.sample(other.samples, len(other.samples))
+        total = self.count + other.count
+        samples = []
+        while len(samples) < self.max_samples and (mine or theirs):
+            if theirs and (not mine or random.random() * total < other.count):
+                context = theirs.pop()
+            else:
+                context = mine.pop()
+            if context not in samples:
+                samples.append(context)
+        self.samples = samples
+        self._sampled = set(samples)
+        self.count = total
+
+    def __len__(self):
+        return self.count
 
 
 def add_error(errs, severity, heading, description, context=None):
-    s = errs.setdefault((severity, heading), {}).setdefault(description, set())
-    if context: s.add(context)
+    errs.add(severity, heading, description, context)
 
 
 def nice_type_name(data_type):
@@ -448,6 +688,56 @@ def check_date_field(obj, field_name, dataset_name, errs):
     return True
 
 
+def match_modified(value):
+    # a date, a repeating duration or a repeating date/duration interval (MODIFIED_REGEX_1, 2 and 3): the first
+    # character tells which of them the value can be, so only one regex is run over it (two, for "R...")
+    start = value[:1]
+    if start == 'P':
+        return MODIFIED_REGEX_2.match(value)
+    elif start == 'R':
+        return MODIFIED_REGEX_2.match(value) or MODIFIED_REGEX_3.match(value)
+    elif '/' in value:
+        return MODIFIED_REGEX_3.match(value)
+    return MODIFIED_REGEX_1.match(value)
+
+
+def match_temporal(value):
+    # a date/date (TEMPORAL_REGEX_1), date/duration (2) or duration/date (3) interval, the last two maybe repeating;
+    # dates and durations hold no "/", so without an "R" prefix what follows the first one tells 1 and 2 apart
+    start = value[:1]
+    if start == 'P':
+        return TEMPORAL_REGEX_3.match(value)
+    elif start == 'R':
+        return TEMPORAL_REGEX_2.match(value) or TEMPORAL_REGEX_3.match(value)
+    elif value.partition('/')[2][:1] == 'P':
+        return TEMPORAL_REGEX_2.match(value)
+    return TEMPORAL_REGEX_1.match(value)
+
+
+DATE_VALUE_MATCHERS = {
+    'modified': match_modified,
+    'temporal': match_temporal,
+    'issued': ISSUED_REGEX.match,
+}
+
+_date_verdicts = dict((field_name, {}) for field_name in DATE_VALUE_MATCHERS)
+
+
+def is_date_value(field_name, value):
+    """
+    Whether value is in one of the ISO 8601 forms accepted for the "modified", "temporal" or "issued" field. Catalogs
+    use the same few dates over and over, so the verdicts are remembered.
+    """
+    verdicts = _date_verdicts[field_name]
+    verdict = verdicts.get(value)
+    if verdict is None:
+        verdict = DATE_VALUE_MATCHERS[field_name](value) is not None
+        if len(verdicts) >= MAX_DATE_VERDICTS:
+            verdicts.clear()
+        verdicts[value] = verdict
+    return verdict
+
+
 def check_url_field(required, obj, field_name, dataset_name, errs):
     # checks that a required or optional field, if specified, looks like a URL
     if not required and (field_name not in obj or obj[field_name] is None): return True  # not required, so OK
@@ -0,0 +1,27 @@
+class Diagnostics(object):
+    """
+    Collects what went wrong while building one catalog: the datasets left out of it and why. Each build gets its
+    own, so concurrent requests never see each other's problems.
+    """
+
+    def __init__(self):
+        # dicts with the id and title of each omitted package, and the list of reasons it was omitted for
+        self.omitted = []
+
+    def omit(self, pkg, errors):
+        # errors are the (reason, message) pairs the entry builder reported
+        self.omitted.append({
+            'id': pkg.get('id'),
+            'title': pkg.get('title'),
+            'reasons': [message for reason, message in errors],
+        })
+
+    def error_log(self):
+        """
+        Returns the omitted datasets and their reasons as text, one reason per line, or '' if nothing was omitted.
+        """
+        lines = []
+        for omitted in self.omitted:
+            lines.append(u"Dataset id=[%s], title=[%s] omitted" % (omitted['id'], omitted['title']))
+            lines.extend(u"    %s" % reason for reason in omitted['reasons'])
+        return u'\n'.join(lines) + u'\n' if lines else u''
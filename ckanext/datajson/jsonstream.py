@@ -0,0 +1,156 @@
+import json
+
+# how much of the document is read at a time
+CHUNK_SIZE = 64 * 1024
+
+# the largest dataset (or other value of the catalog) that is held in memory to be decoded
+MAX_VALUE_SIZE = 16 * 1024 * 1024
+
+WHITESPACE = ' \t\n\r'
+
+
+class NotACatalog(ValueError):
+    """
+    Raised for well formed JSON that isn't a data.json document.
+    """
+
+
+def iter_datasets(f, chunk_size=CHUNK_SIZE, max_value_size=MAX_VALUE_SIZE):
+    """
+    Yields the datasets of the data.json document read from the file-like object f, one at a time, as they are
+    decoded. The document is either an array of datasets (v1.0) or a catalog object with a "dataset" array (v1.1).
+    Only one dataset is held in memory at a time, so documents of any size can be checked. Raises NotACatalog for
+    other documents, and ValueError for malformed JSON or a single value larger than max_value_size.
+    """
+    reader = Reader(f, chunk_size, max_value_size)
+    start = reader.peek()
+    if start == '[':
+        for dataset in reader.iter_array():
+            yield dataset
+    elif start == '{':
+        reader.expect('{')
+        separator = None
+        while reader.peek() != '}':
+            if separator:
+                reader.expect(',')
+            separator = True
+            offset = reader.offset()
+            key = reader.decode()
+            if not isinstance(key, basestring):
+                raise ValueError('Expecting a property name at byte %d' % offset)
+            reader.expect(':')
+            if key == 'dataset':
+                if reader.peek() != '[':
+                    raise NotACatalog('The "dataset" field of the catalog must be an array.')
+                for dataset in reader.iter_array():
+                    yield dataset
+            else:
+                reader.decode()
+        reader.expect('}')
+    elif start:
+        raise NotACatalog('The file must be an array or an object at its top level.')
+    else:
+        raise ValueError('The file is empty')
+    if reader.peek():
+        raise ValueError('Extra data after the end of the document at byte %d' % reader.offset())
+
+
+class Reader(object):
+    """
+    Decodes JSON values one at a time from a file-like object, keeping only the undecoded part of the document in
+    memory.
+    """
+
+    def __init__(self, f, chunk_size=CHUNK_SIZE, max_value_size=MAX_VALUE_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.max_value_size = max_value_size
+        self.decoder = json.JSONDecoder()
+        self.buf = ''
+        self.pos = 0
+        # bytes of the document dropped from the front of buf
+        self.consumed = 0
+        self.eof = False
+
+    def offset(self):
+        return self.consumed + self.pos
+
+    def fill(self, size):
+        """
+        Reads at least size more bytes into the buffer, unless the document ends first. Returns False at its end.
+        """
+        if self.eof:
+            return False
+        self.consumed += self.pos
+        parts = [self.buf[self.pos:]]
+        read = 0
+        while read < size:
+            data = self.f.read(max(self.chunk_size, size - read))
+            if not data:
+                self.eof = True
+                break
+            parts.append(data)
+            read += len(data)
+        self.buf = ''.join(parts)
+        self.pos = 0
+        return read > 0
+
+    def peek(self):
+        """
+        Skips whitespace and returns the next character of the document, or '' at its end.
+        """
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill(self.chunk_size):
+                return ''
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError('Expecting %r at byte %d, found %r' % (char, self.offset(), found))
+        self.pos += 1
+
+    def decode(self):
+        """
+        Decodes the next value of the document, reading more of it until the value is complete.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                end = None
+            # a value that runs to the end of the buffer (a number, or an incomplete one) might go on after it
+            if end is not None and (end < len(self.buf) or self.eof):
+                self.pos = end
+                return value
+            pending = len(self.buf) - self.pos
+            if pending > self.max_value_size:
+                raise ValueError('The value at byte %d is malformed or larger than %d bytes' % (self.offset(),
+                                                                                                 self.max_value_size))
+            # read as much again as is pending, so a large value isn't decoded over and over
+            if not self.fill(pending) and end is None:
+                # all of the rest of the document is read, and still doesn't decode: decode it again for the error
+                try:
+                    self.decoder.raw_decode(self.buf, self.pos)
+                except ValueError as e:
+                    raise ValueError('%s, in the value at byte %d' % (e, self.offset()))
+
+    def iter_array(self):
+        """
+        Yields the values of the array starting at the current position.
+        """
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.decode()
+            if self.peek() == ',':
+                self.pos += 1
+            else:
+                self.expect(']')
+                return
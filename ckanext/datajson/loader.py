@@ -0,0 +1,172 @@
+import urlparse
+
+import ckan.model as model
+from ckan.lib.munge import munge_filename
+from pylons import config
+import sqlalchemy
+import sqlalchemy.orm
+
+# how many packages' extras, tags and resources are fetched per round trip
+CHUNK_SIZE = 500
+
+
+def public_package_ids():
+    """
+    Returns the ids of the active, public packages, most recently modified first (the order
+    current_package_list_with_resources uses).
+    """
+    query = model.Session.query(model.Package.id) \
+        .filter(model.Package.state == 'active') \
+        .filter(model.Package.private == False) \
+        .order_by(model.Package.metadata_modified.desc(), model.Package.id)
+    return [pkg_id for (pkg_id,) in query]
+
+
+def iter_public_packages(chunk_size=CHUNK_SIZE):
+    return iter_packages(public_package_ids(), chunk_size)
+
+
+def iter_packages(package_ids, chunk_size=CHUNK_SIZE):
+    """
+    Yields a lightweight dict for each of the given package ids, in the same order. The dicts are laid out like
+    CKAN's dictized packages but only hold the fields the data.json builder reads. Packages are loaded chunk_size at
+    a time, with one query each for the packages, their extras, tags and resources, so only one chunk is held in
+    memory at once.
+    """
+    for start in range(0, len(package_ids), chunk_size):
+        for pkg in load_packages(package_ids[start:start + chunk_size]):
+            yield pkg
+
+
+def load_packages(package_ids):
+    """
+    Loads the given packages with a fixed number of queries and returns them as lightweight dicts, in the order of
+    package_ids. Ids of packages that don't exist are skipped.
+    """
+    if not package_ids:
+        return []
+
+    packages = {}
+    for row in model.Session.query(model.Package.id, model.Package.name, model.Package.title,
+                                   model.Package.notes, model.Package.owner_org, model.Package.private,
+                                   model.Package.state, model.Package.metadata_modified) \
+            .filter(model.Package.id.in_(package_ids)):
+        packages[row.id] = {
+            'id': row.id,
+            'name': row.name,
+            'title': row.title,
+            'notes': row.notes,
+            'owner_org': row.owner_org,
+            'private': row.private,
+            'state': row.state,
+            'metadata_modified': row.metadata_modified.isoformat() if row.metadata_modified else None,
+            'extras': [],
+            'tags': [],
+            'resources': [],
+        }
+
+    for package_id, key, value in model.Session.query(model.PackageExtra.package_id, model.PackageExtra.key,
+                                                      model.PackageExtra.value) \
+            .filter(model.PackageExtra.package_id.in_(package_ids)) \
+            .filter(model.PackageExtra.state == 'active') \
+            .order_by(model.PackageExtra.key):
+        packages[package_id]['extras'].append({'key': key, 'value': value})
+
+    for package_id, name in model.Session.query(model.PackageTag.package_id, model.Tag.name) \
+            .join(model.Tag, model.Tag.id == model.PackageTag.tag_id) \
+            .filter(model.PackageTag.package_id.in_(package_ids)) \
+            .filter(model.PackageTag.state == 'active') \
+            .order_by(model.Tag.name):
+        packages[package_id]['tags'].append({'name': name, 'display_name': name})
+
+    site_url = config.get('ckan.site_url', '')
+    for row in model.Session.query(model.Resource.package_id, model.Resource.id, model.Resource.url,
+                                   model.Resource.url_type, model.Resource.format, model.Resource.name,
+                                   model.Resource.description, model.Resource.resource_type,
+                                   model.Resource.extras) \
+            .filter(model.Resource.package_id.in_(package_ids)) \
+            .filter(model.Resource.state == 'active') \
+            .order_by(model.Resource.package_id, model.Resource.position):
+        resource = {
+            'id': row.id,
+            'url': resource_url(row.url, row.url_type, row.package_id, row.id, site_url),
+            'url_type': row.url_type,
+            'format': row.format,
+            'name': row.name,
+            'description': row.description,
+            'resource_type': row.resource_type,
+        }
+        # like resource_dictize, flatten the free-form resource extras (formatReadable, conformsTo...) into the dict
+        resource.update(row.extras or {})
+        packages[row.package_id]['resources'].append(resource)
+
+    return [packages[pkg_id] for pkg_id in package_ids if pkg_id in packages]
+
+
+def resource_url(url, url_type, package_id, resource_id, site_url):
+    """
+    Qualifies a resource URL the way CKAN's resource_dictize does: an uploaded file gets the address it is downloaded
+    from on this site, and an address without a scheme gets http:// put in front of it.
+
+    >>> print resource_url('data.csv', 'upload', 'pkg-id', 'res-id', 'http://data.example.org/')
+    http://data.example.org/dataset/pkg-id/resource/res-id/download/data.csv
+    >>> print resource_url('example.org/data.csv', None, 'pkg-id', 'res-id', 'http://data.example.org')
+    http://example.org/data.csv
+    """
+    url = url or ''
+    if url_type == 'upload':
+        return '%s/dataset/%s/resource/%s/download/%s' % (site_url.rstrip('/'), package_id, resource_id,
+                                                          munge_filename(url))
+    if not urlparse.urlsplit(url).scheme:
+        return u'http://' + url.lstrip('/')
+    return url
+
+
+def parent_refs(packages):
+    """
+    Returns the set of parent datasets (package ids or names) named by the parent_dataset extras of the packages.
+    """
+    return set(extra['value'] for pkg in packages for extra in pkg['extras']
+               if extra['key'] == 'parent_dataset' and extra['value'])
+
+
+def load_parent_identifiers(packages):
+    """
+    Looks up, with a single query, the unique_id of the parent dataset named by the parent_dataset extra of each of
+    the given packages. Returns a dict from each parent reference (a package id or name) to that unique_id.
+    """
+    refs = parent_refs(packages)
+    if not refs:
+        return {}
+
+    identifiers = {}
+    for pkg_id, name, unique_id in model.Session.query(model.Package.id, model.Package.name, model.PackageExtra.value) \
+            .join(model.PackageExtra, model.PackageExtra.package_id == model.Package.id) \
+            .filter(sqlalchemy.or_(model.Package.id.in_(refs), model.Package.name.in_(refs))) \
+            .filter(model.PackageExtra.key == 'unique_id') \
+            .filter(model.PackageExtra.state == 'active'):
+        for ref in (pkg_id, name):
+            if ref in refs:
+                identifiers[ref] = unique_id
+    return identifiers
+
+
+def load_all_parent_identifiers():
+    """
+    Like load_parent_identifiers, but for every package in the site that has a parent_dataset extra, in one query.
+    Used when building a whole catalog, so no more queries are needed however many child datasets it has.
+    """
+    child_extra = sqlalchemy.orm.aliased(model.PackageExtra)
+    identifiers = {}
+    for pkg_id, name, ref, unique_id in model.Session.query(model.Package.id, model.Package.name, child_extra.value,
+                                                            model.PackageExtra.value) \
+            .join(model.PackageExtra, model.PackageExtra.package_id == model.Package.id) \
+            .join(child_extra, sqlalchemy.or_(child_extra.value == model.Package.id,
+                                              child_extra.value == model.Package.name)) \
+            .filter(child_extra.key == 'parent_dataset') \
+            .filter(child_extra.state == 'active') \
+            .filter(model.PackageExtra.key == 'unique_id') \
+            .filter(model.PackageExtra.state == 'active') \
+            .distinct():
+        identifiers[ref] = unique_id
+    return identifiers
@@ -0,0 +1,137 @@
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+
+import loader
+import stats
+from validation import verdicts
+
+logger = logging.getLogger('datajson')
+
+# how many packages are sent to a worker process in one go
+BATCH_SIZE = 64
+
+# the worker pools of this process, by number of workers, with the id of the process that created them
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PackageRenderer(object):
+    """
+    Runs an entry builder such as make_json_entry over packages, either in this process or fanned out to a pool of
+    worker processes when processes is more than 1. The builder must be a module level function taking a package
+    dict, a dict of parent dataset identifiers (see loader.load_parent_identifiers) and a list to append the reasons
+    for leaving the package out to, as (reason, message) pairs, so that the workers never need the database. Packages
+    left out for a reason are recorded in diagnostics (a Diagnostics), or logged if there is none. Workers validate
+    entries with verdict caches of their own, and each batch of packages carries the generation of this process's
+    cache for the worker's cache to follow (see validation.VerdictCache.follow). Time spent and omissions are counted
+    towards the build active on the calling thread (see stats.BuildStats), if any. Renderers share the worker pool of
+    their process (see get_pool).
+    """
+
+    def __init__(self, render, processes=None, parent_identifiers=None, diagnostics=None):
+        self.render = render
+        # parent dataset identifiers loaded up front for a whole catalog; otherwise they are looked up a chunk at a time
+        self.parent_identifiers = parent_identifiers
+        self.diagnostics = diagnostics
+        self.pool = None
+        if processes > 1:
+            self.pool = get_pool(processes)
+
+    def close(self):
+        # the pool outlives the renderer, for the next build to use
+        self.pool = None
+
+    def render_many(self, packages, reasons=None):
+        """
+        Renders a list of packages, returning the results in the same order. If reasons is a list, the reason each
+        package was left out for (None for those that were rendered) is appended to it.
+        """
+        parent_identifiers = self.parent_identifiers
+        if parent_identifiers is None:
+            with stats.phase('load'):
+                parent_identifiers = loader.load_parent_identifiers(packages)
+
+        if self.pool is None:
+            rendered = []
+            for pkg in packages:
+                with stats.phase('render'):
+                    rendered.append(render_package(self.render, pkg, parent_identifiers))
+        else:
+            batches = []
+            for start in range(0, len(packages), BATCH_SIZE):
+                batch = packages[start:start + BATCH_SIZE]
+                # only send the workers the identifiers their batch needs
+                batch_identifiers = dict((ref, parent_identifiers[ref]) for ref in loader.parent_refs(batch)
+                                         if ref in parent_identifiers)
+                batches.append((self.render, batch, batch_identifiers, verdicts.generation))
+            rendered = []
+            with stats.phase('render'):
+                mapped = self.pool.map(render_batch, batches)
+            for batch_results in mapped:
+                rendered.extend(batch_results)
+
+        build = stats.current()
+        results = []
+        for pkg, (result, errors) in zip(packages, rendered):
+            if errors:
+                self.omit(pkg, errors)
+            reason = None
+            if result is None:
+                # packages left out without a reason are the ones the catalog excludes on purpose (non-public ones)
+                reason = errors[0][0] if errors else 'excluded'
+                if build:
+                    build.omit(reason)
+            if reasons is not None:
+                reasons.append(reason)
+            results.append(result)
+        return results
+
+    def iter_render(self, packages, chunk_size=loader.CHUNK_SIZE):
+        """
+        Renders the packages of any iterable chunk_size at a time, yielding the results in order.
+        """
+        packages = iter(packages)
+        while True:
+            chunk = list(itertools.islice(packages, chunk_size))
+            if not chunk:
+                break
+            for result in self.render_many(chunk):
+                yield result
+
+    def omit(self, pkg, errors):
+        if self.diagnostics is not None:
+            self.diagnostics.omit(pkg, errors)
+        else:
+            for reason, message in errors:
+                logger.warn(message)
+            logger.warn("Dataset id=[%s], title=[%s] omitted", pkg.get('id'), pkg.get('title'))
+
+
+def get_pool(processes):
+    """
+    Returns this process's pool of processes workers, creating it on first use. The pool is kept for the life of the
+    process, so that the web process forks its workers once rather than on every request that builds a catalog
+    (with its database connections and threads in whatever state they are at the time). A process forked from one
+    that already has a pool gets a pool of its own.
+    """
+    with _pools_lock:
+        pool, pid = _pools.get(processes, (None, None))
+        if pool is None or pid != os.getpid():
+            pool = multiprocessing.Pool(processes)
+            _pools[processes] = (pool, os.getpid())
+        return pool
+
+
+def render_package(render, pkg, parent_identifiers):
+    errors = []
+    result = render(pkg, parent_identifiers, errors)
+    return result, errors
+
+
+def render_batch(args):
+    render, packages, parent_identifiers, generation = args
+    verdicts.follow(generation)
+    return [render_package(render, pkg, parent_identifiers) for pkg in packages]
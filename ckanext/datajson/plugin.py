@@ -3,36 +3,34 @@ import ckan.plugins as p
 from ckan.lib.base import BaseController, render, c
 import ckan.model as model
 from pylons import request, response
-import ckan.lib.dictization.model_dictize as model_dictize
+import sqlalchemy
 import json, re
+import calendar
+import datetime
+import dateutil.parser
+import dateutil.tz
+import urllib
+import hashlib
+import itertools
 import logging
-from jsonschema.exceptions import best_match
-import StringIO
 
 logger = logging.getLogger('datajson')
 
 
-def get_validator():
-    import os
-    from jsonschema import Draft4Validator, FormatChecker
-
-    schema_path = os.path.join(os.path.dirname(__file__), 'schema', 'federal-v1.1', 'dataset.json')
-    with open(schema_path, 'r') as file:
-        schema = json.loads(file.read())
-        return Draft4Validator(schema, format_checker=FormatChecker())
-
-    logger.warn('Unable to create validator')
-    return None
-
-
-validator = get_validator()
-
 try:
     from collections import OrderedDict  # 2.7
 except ImportError:
     from sqlalchemy.util import OrderedDict
 
-from build_datajson import make_datajson_entry, make_datajson_catalog
+import loader
+from parallel import PackageRenderer
+from cache import CatalogCache, EntryCache, ENCODINGS, choose_encoding
+from build_datajson import make_datajson_entry, make_datajson_catalog, iter_datajson_catalog, \
+    iter_serialized_catalog, encode_if_unicode
+from zipstream import ZipStream
+from validation import LEVELS, validate_entry, schema_error, verdicts
+from diagnostics import Diagnostics
+from stats import BuildStats, metrics
 
 # from build_enterprisedatajson import make_enterprisedatajson_entry
 from build_datajsonld import dataset_to_jsonld
@@ -41,6 +39,8 @@ from build_datajsonld import dataset_to_jsonld
 class DataJsonPlugin(p.SingletonPlugin):
     p.implements(p.interfaces.IConfigurer)
     p.implements(p.interfaces.IRoutes, inherit=True)
+    p.implements(p.interfaces.IPackageController, inherit=True)
+    p.implements(p.interfaces.IActions)
 
     def update_config(self, config):
         # Must use IConfigurer rather than IConfigurable because only IConfigurer
@@ -57,6 +57,28 @@ class DataJsonPlugin(p.SingletonPlugin):
         DataJsonPlugin.ld_title = config.get("ckan.site_title", "Catalog")
         DataJsonPlugin.site_url = config.get("ckan.site_url")
 
+        DataJsonPlugin.max_page_rows = int(config.get("ckanext.datajson.max_page_rows", 1000))
+
+        # Render catalog entries with this many worker processes, or in the web process itself if 1 or less.
+        DataJsonPlugin.build_processes = int(config.get("ckanext.datajson.build_processes", 1))
+
+        # Keep a rendered copy of the catalog around until a package changes, in memory or in cache_dir if given.
+        DataJsonPlugin.cache_enabled = config.get("ckanext.datajson.cache_enabled", "False") == 'True'
+        DataJsonPlugin.catalog_cache = None
+        DataJsonPlugin.entry_cache = None
+        if DataJsonPlugin.cache_enabled:
+            DataJsonPlugin.catalog_cache = CatalogCache(config.get("ckanext.datajson.cache_dir"))
+            DataJsonPlugin.entry_cache = EntryCache()
+
+        # How thoroughly catalog entries are checked before they are published: off, fast or full (see validation.py).
+        DataJsonPlugin.validation_level = config.get("ckanext.datajson.validation_level", "full")
+        if DataJsonPlugin.validation_level not in LEVELS:
+            logger.warn("Unknown ckanext.datajson.validation_level %s, using full", DataJsonPlugin.validation_level)
+            DataJsonPlugin.validation_level = 'full'
+
+        # Serve the running totals of the catalog builds, for Prometheus or the like, at /datajson/metrics.
+        DataJsonPlugin.metrics_enabled = config.get("ckanext.datajson.metrics_enabled", "False") == 'True'
+
         # Adds our local templates directory. It's smart. It knows it's
         # relative to the path of *this* file. Wow.
         p.toolkit.add_template_directory(config, "templates")
@@ -83,11 +105,86 @@ class DataJsonPlugin(p.SingletonPlugin):
         m.connect('enterprise_data_inventory', '/organization/{org}/edi.json',
                   controller='ckanext.datajson.plugin:DataJsonController', action='generate_edi')
 
+        if DataJsonPlugin.metrics_enabled:
+            m.connect('datajson_metrics', '/datajson/metrics',
+                      controller='ckanext.datajson.plugin:DataJsonController', action='metrics')
+
         # /pod/validate
         # m.connect('datajsonvalidator', "/pod/validate", controller='ckanext.datajson.plugin:DataJsonController', action='validator')
 
         return m
 
+    def get_actions(self):
+        return {
+            'bulk_update_private': bulk_update_private,
+            'bulk_update_public': bulk_update_public,
+            'bulk_update_delete': bulk_update_delete,
+        }
+
+    def after_create(self, context, pkg_dict):
+        self.invalidate_catalog(pkg_dict)
+
+    def after_update(self, context, pkg_dict):
+        self.invalidate_catalog(pkg_dict)
+
+    def after_delete(self, context, pkg_dict):
+        # CKAN leaves metadata_modified alone when deleting a package. Bump it here, within the same transaction, so
+        # that the ETags and the modified_since feed pick up deletions too.
+        pkg = model.Package.get(pkg_dict['id'])
+        if pkg:
+            pkg.metadata_modified = datetime.datetime.utcnow()
+            pkg_dict = dict(pkg_dict, owner_org=pkg.owner_org)
+        self.invalidate_catalog(pkg_dict)
+
+    def invalidate_catalog(self, pkg_dict):
+        invalidate_catalog(pkg_dict.get('owner_org'))
+
+
+def invalidate_catalog(owner_org=None):
+    # A package change can alter data.json and its organization's listings, so their cached copies are rebuilt on the
+    # next request. The listings of other organizations are left alone.
+    cache = DataJsonPlugin.catalog_cache
+    if cache:
+        cache.invalidate('data.json')
+        if owner_org:
+            cache.invalidate(listing_cache_name('pdl', owner_org))
+            cache.invalidate(listing_cache_name('edi', owner_org))
+
+
+@p.toolkit.chained_action
+def bulk_update_private(original_action, context, data_dict):
+    return bulk_update(original_action, context, data_dict)
+
+
+@p.toolkit.chained_action
+def bulk_update_public(original_action, context, data_dict):
+    return bulk_update(original_action, context, data_dict)
+
+
+@p.toolkit.chained_action
+def bulk_update_delete(original_action, context, data_dict):
+    return bulk_update(original_action, context, data_dict)
+
+
+def bulk_update(original_action, context, data_dict):
+    """
+    Runs one of CKAN's bulk actions of the organization page, which update the package table directly: they leave
+    metadata_modified alone and skip the package hooks. metadata_modified is moved on here, within the transaction
+    the action commits, so that the ETags, Last-Modified times and the modified_since feed pick up datasets made
+    private, public or deleted in bulk, and the organization's cached catalogs are invalidated once it has run.
+    """
+    datasets = data_dict.get('datasets') or []
+    org_id = data_dict.get('org_id')
+    if datasets and org_id:
+        # the same packages the action updates
+        model.Session.query(model.Package) \
+            .filter(model.Package.id.in_(datasets)) \
+            .filter(model.Package.owner_org == org_id) \
+            .update({'metadata_modified': datetime.datetime.utcnow()}, synchronize_session=False)
+    result = original_action(context, data_dict)
+    invalidate_catalog(org_id)
+    return result
+
 
 class DataJsonController(BaseController):
     def generate_output(self, format):
@@ -98,9 +195,42 @@ class DataJsonController(BaseController):
         del response.headers["Cache-Control"]
         del response.headers["Pragma"]
 
+        # ?modified_since=<date> asks for the changes since then, ?rows=N for a single window of the catalog; both
+        # work out their own validators
+        if format == 'json' and 'modified_since' in request.GET:
+            return self.generate_changes()
+        if format == 'json' and 'rows' in request.GET:
+            return self.generate_page()
+
+        # the cached catalog is kept pre-compressed, so pick the copy to send before working out its ETag
+        encoding = None
+        if format == 'json' and DataJsonPlugin.catalog_cache:
+            encoding = choose_encoding(request.headers.get('Accept-Encoding'), ENCODINGS)
+            response.headers['Vary'] = 'Accept-Encoding'
+
+        validators = catalog_validators(format)
+        if self.not_modified(validators, encoding=encoding):
+            return ''
+
+        if format == 'json' and DataJsonPlugin.catalog_cache:
+            # The package hooks invalidate the cache before CKAN commits, so the stored catalog is also tied to the
+            # packages it was built from, like the organization listings are
+            payload = DataJsonPlugin.catalog_cache.fetch('data.json', make_cached_json, version=validators[0])
+            if payload.stale:
+                forget_validators()
+            if encoding:
+                response.content_encoding = encoding
+            response.content_length = payload.size(encoding)
+            return payload.iter_chunks(encoding)
+
         # TODO special processing for enterprise
         # output
-        data = make_json()
+        stats = BuildStats('data.json')
+        data = make_json(stats)
+
+        if format == 'json':
+            # Stream the catalog out as entries are built rather than rendering it all up front
+            return release_session(stats.output(iter_datajson_catalog(data)))
 
         if format == 'json-ld':
             # Convert this to JSON-LD.
@@ -122,6 +252,92 @@ class DataJsonController(BaseController):
 
         return p.toolkit.literal(json.dumps(data))
 
+    def not_modified(self, validators, encoding=None):
+        """
+        Sets the ETag and Last-Modified headers of a catalog response from the validators catalog_validators worked
+        out, and answers with a 304 if the copy the client already has is still current. Returns True in that case,
+        so the caller can skip rendering the catalog altogether. Each content coding of a catalog gets its own ETag.
+        """
+        etag, last_modified = validators
+        if encoding:
+            etag = '%s-%s' % (etag, encoding)
+        response.etag = etag
+        if last_modified:
+            response.last_modified = last_modified
+
+        # If-None-Match takes precedence, If-Modified-Since only counts when no ETag was sent
+        if request.headers.get('If-None-Match'):
+            if etag not in request.if_none_match:
+                return False
+        elif not last_modified or not request.if_modified_since \
+                or calendar.timegm(request.if_modified_since.utctimetuple()) < \
+                calendar.timegm(last_modified.timetuple()):
+            return False
+
+        response.status_int = 304
+        return True
+
+    def generate_page(self):
+        """
+        Outputs one window of the data.json catalog. Packages are ordered by id and paged through with the ids either
+        side of the window (?rows=N&after=<id> or ?rows=N&before=<id>), so only the packages on the page are loaded.
+        Links to the neighbouring windows are sent in a Link header.
+        """
+        try:
+            rows = int(request.GET['rows'])
+        except ValueError:
+            rows = 0
+        if rows < 1:
+            response.status_int = 400
+            return "Invalid rows parameter"
+        rows = min(rows, DataJsonPlugin.max_page_rows)
+
+        packages, has_prev, has_next = get_json_packages_page(rows, request.GET.get('after'),
+                                                              request.GET.get('before'))
+        links = ['<%s>; rel="first"' % self.page_url(rows)]
+        if packages and has_prev:
+            links.append('<%s>; rel="prev"' % self.page_url(rows, before=packages[0]['id']))
+        if packages and has_next:
+            links.append('<%s>; rel="next"' % self.page_url(rows, after=packages[-1]['id']))
+        response.headers['Link'] = ', '.join(links)
+
+        parent_identifiers = loader.load_parent_identifiers(packages)
+        if self.not_modified(page_validators(packages, parent_identifiers, has_prev, has_next)):
+            return ''
+        return release_session(iter_datajson_catalog(iter_json_entries(packages, parent_identifiers)))
+
+    def generate_changes(self):
+        """
+        Outputs the data.json entries of the packages modified after ?modified_since=<ISO 8601 date>, along with
+        the identifiers of datasets that have been removed from the catalog since then (deleted, made private, or
+        no longer producing an entry) under a 'removed' key.
+        """
+        try:
+            since = dateutil.parser.parse(request.GET['modified_since'])
+        except (ValueError, OverflowError):
+            response.status_int = 400
+            return "Invalid modified_since parameter"
+        # metadata_modified is stored as UTC without a timezone
+        if since.tzinfo:
+            since = since.astimezone(dateutil.tz.tzutc()).replace(tzinfo=None)
+
+        if self.not_modified(changes_validators()):
+            return ''
+        entries, removed = make_json_changes(since)
+        catalog = make_datajson_catalog(entries)
+        catalog['removed'] = removed
+        # keep the dataset list last, as in the full catalog
+        catalog['dataset'] = catalog.pop('dataset')
+        return p.toolkit.literal(json.dumps(catalog))
+
+    def page_url(self, rows, **cursor):
+        params = [('rows', rows)] + cursor.items()
+        return request.path_url + '?' + urllib.urlencode(params)
+
+    def metrics(self):
+        response.content_type = 'text/plain; version=0.0.4; charset=UTF-8'
+        return metrics.render()
+
     def generate_json(self):
         return self.generate_output('json')
 
@@ -134,28 +350,18 @@ class DataJsonController(BaseController):
             c.source_url = request.POST["url"]
             c.errors = []
 
-            import urllib, json
-            from datajsonvalidator import do_validation
+            import urllib
+            from datajsonvalidator import do_stream_validation
 
-            body = None
+            # the file is validated as it is downloaded, so catalogs of any size can be checked
             try:
-                body = json.load(urllib.urlopen(c.source_url))
+                do_stream_validation(urllib.urlopen(c.source_url), c.errors)
             except IOError as e:
                 c.errors.append(("Error Loading File", ["The address could not be loaded: " + unicode(e)]))
-            except ValueError as e:
-                c.errors.append(("Invalid JSON", ["The file does not meet basic JSON syntax requirements: " + unicode(
-                    e) + ". Try using JSONLint.com."]))
             except Exception as e:
-                c.errors.append((
-                "Internal Error", ["Something bad happened while trying to load and parse the file: " + unicode(e)]))
-
-            if body:
-                try:
-                    do_validation(body, c.errors)
-                except Exception as e:
-                    c.errors.append(("Internal Error", ["Something bad happened: " + unicode(e)]))
-                if len(c.errors) == 0:
-                    c.errors.append(("No Errors", ["Great job!"]))
+                c.errors.append(("Internal Error", ["Something bad happened: " + unicode(e)]))
+            if len(c.errors) == 0:
+                c.errors.append(("No Errors", ["Great job!"]))
 
         return render('datajsonvalidator.html')
 
@@ -169,7 +375,11 @@ class DataJsonController(BaseController):
             # allow caching of response (e.g. by Apache)
             del response.headers["Cache-Control"]
             del response.headers["Pragma"]
-            return make_pdl(match.group(1))
+
+            validators = catalog_validators('pdl', match.group(1))
+            if self.not_modified(validators):
+                return ''
+            return make_pdl(match.group(1), version=validators[0])
         return "Invalid organization id"
 
     def generate_edi(self):
@@ -182,154 +392,342 @@ class DataJsonController(BaseController):
             # allow caching of response (e.g. by Apache)
             del response.headers["Cache-Control"]
             del response.headers["Pragma"]
-            return make_edi(match.group(1))
+
+            validators = catalog_validators('edi', match.group(1))
+            if self.not_modified(validators):
+                return ''
+            return make_edi(match.group(1), version=validators[0])
         return "Invalid organization id"
 
 
-def make_json():
-    # Build the data.json file.
-    packages = p.toolkit.get_action("current_package_list_with_resources")(None, {})
-    output = []
-    # Create data.json only using public and public-restricted datasets, datasets marked non-public are not exposed
+def catalog_validators(name, owner_org=None):
+    """
+    Works out a strong ETag and a Last-Modified time for a catalog with two aggregate queries, so that answering a
+    request from the cache, or with a 304, costs the same however many packages the catalog has. The ETag is a digest
+    of the number of packages in the catalog (the public ones for /data.json, or all of the organization's packages
+    when owner_org is given), of their latest metadata_modified and of Last-Modified. It only depends on the database,
+    so every web process sends the same one for the same catalog. Last-Modified is the latest metadata_modified of any
+    package in scope, whatever its state, so that datasets being deleted or made private (in bulk too, see
+    bulk_update) move it on.
+    """
+    query = model.Session.query(sqlalchemy.func.count(model.Package.id),
+                                sqlalchemy.func.max(model.Package.metadata_modified)) \
+        .filter(model.Package.state == 'active')
+    last_modified_query = model.Session.query(sqlalchemy.func.max(model.Package.metadata_modified))
+    if owner_org:
+        query = query.filter(model.Package.owner_org == owner_org)
+        last_modified_query = last_modified_query.filter(model.Package.owner_org == owner_org)
+    else:
+        query = query.filter(model.Package.private == False)
+
+    count, latest = query.one()
+    last_modified = last_modified_query.scalar()
+
+    digest = hashlib.sha1(name)
+    digest.update('%s %s %s\n' % (count, latest.isoformat() if latest else '',
+                                  last_modified.isoformat() if last_modified else ''))
+
+    return digest.hexdigest(), last_modified
+
+
+def changes_validators():
+    """
+    Works out the ETag and Last-Modified time of the change feed from the latest metadata_modified of any package,
+    with a single aggregate query. Every change the feed reports moves it on, deletions included (see after_delete).
+    """
+    last_modified = model.Session.query(sqlalchemy.func.max(model.Package.metadata_modified)).scalar()
+    digest = hashlib.sha1('changes %s' % (last_modified.isoformat() if last_modified else ''))
+    return digest.hexdigest(), last_modified
+
+
+def page_validators(packages, parent_identifiers, has_prev, has_next):
+    """
+    Works out the ETag of a window of data.json from the packages in it, which are loaded anyway, the identifiers of
+    their parent datasets, and whether there are more packages either side of it. There is no Last-Modified time:
+    packages that leave the window don't show in what is left of it.
+    """
+    digest = hashlib.sha1('page %s %s\n' % (has_prev, has_next))
     for pkg in packages:
-        extras = dict([(x['key'], x['value']) for x in pkg['extras']])
-        try:
-            if not (re.match(r'[Nn]on-public', extras['public_access_level'])):
-                datajson_entry = make_datajson_entry(pkg)
+        digest.update('%s %s\n' % (pkg['id'], pkg['metadata_modified'] or ''))
+    for ref, unique_id in sorted(parent_identifiers.items()):
+        digest.update('%s %s\n' % (ref, unique_id))
+    return digest.hexdigest(), None
+
+
+def make_json(stats=None):
+    # Build the data.json file. Packages are loaded a chunk at a time and their entries built as the returned
+    # generator is consumed. The identifiers of all parent datasets are looked up front, with a single query.
+    # The build is counted and timed in stats, a BuildStats, and starts a new generation of validation verdicts.
+    stats = stats or BuildStats()
+    verdicts.new_generation()
+    with stats.phase('load'):
+        packages = get_json_packages()
+        parent_identifiers = loader.load_all_parent_identifiers()
+    return stats.entries(iter_json_entries(stats.packages(packages), parent_identifiers))
+
+
+def get_json_packages():
+    return loader.iter_public_packages()
+
+
+def get_json_packages_page(rows, after=None, before=None):
+    """
+    Loads a window of at most rows public packages, ordered by id, that starts after the package id after or ends
+    before the package id before. Returns the dictized packages, and whether there are more packages before and after
+    the window.
+    """
+    query = model.Session.query(model.Package.id) \
+        .filter(model.Package.state == 'active') \
+        .filter(model.Package.private == False)
+    if before:
+        ids = [pkg_id for (pkg_id,) in query.filter(model.Package.id < before)
+               .order_by(model.Package.id.desc()).limit(rows + 1)]
+        has_prev, has_next = len(ids) > rows, True
+        ids = list(reversed(ids[:rows]))
+    else:
+        if after:
+            query = query.filter(model.Package.id > after)
+        ids = [pkg_id for (pkg_id,) in query.order_by(model.Package.id).limit(rows + 1)]
+        has_prev, has_next = bool(after), len(ids) > rows
+        ids = ids[:rows]
+
+    return loader.load_packages(ids), has_prev, has_next
+
+
+def make_json_changes(since):
+    """
+    Builds the data.json entries of the packages modified after since, and lists the identifiers of those that
+    should no longer appear in the catalog. Only the changed packages are read.
+    """
+    changed = model.Session.query(model.Package.id).filter(model.Package.metadata_modified > since)
+
+    removed = [uid for (uid,) in model.Session.query(model.PackageExtra.value)
+               .join(model.Package, model.Package.id == model.PackageExtra.package_id)
+               .filter(model.Package.metadata_modified > since)
+               .filter(sqlalchemy.or_(model.Package.state != 'active', model.Package.private == True))
+               .filter(model.PackageExtra.key == 'unique_id')
+               .filter(model.PackageExtra.state == 'active')
+               .order_by(model.Package.metadata_modified)]
+
+    changed_ids = [pkg_id for (pkg_id,) in changed
+                   .filter(model.Package.state == 'active')
+                   .filter(model.Package.private == False)
+                   .order_by(model.Package.metadata_modified)]
+
+    entries = []
+    renderer = PackageRenderer(make_json_entry, DataJsonPlugin.build_processes)
+    try:
+        for start in range(0, len(changed_ids), loader.CHUNK_SIZE):
+            packages = loader.load_packages(changed_ids[start:start + loader.CHUNK_SIZE])
+            for pkg_dict, datajson_entry in zip(packages, renderer.render_many(packages)):
                 if datajson_entry:
-                    output.append(datajson_entry)
+                    entries.append(datajson_entry)
                 else:
-                    logger.warn("Dataset id=[%s], title=[%s] omitted\n", pkg.get('id', None), pkg.get('title', None))
-        except KeyError:
-            logger.warn("Dataset id=[%s], title=[%s] missing required 'public_access_level' field", pkg.get('id', None),
-                        pkg.get('title', None))
-            pass
-    return output
-
-
-def make_edi(owner_org):
-    # Error handler for creating error log
-    stream = StringIO.StringIO()
-    eh = logging.StreamHandler(stream)
-    eh.setLevel(logging.WARN)
-    formatter = logging.Formatter('%(asctime)s - %(message)s')
-    eh.setFormatter(formatter)
-    logger.addHandler(eh)
-
-    # Build the data.json file.
-    packages = get_all_group_packages(group_id=owner_org)
-    output = []
-    for pkg in packages:
-        if pkg['owner_org'] == owner_org:
-            datajson_entry = make_datajson_entry(pkg)
-            if datajson_entry and is_valid(datajson_entry):
-                output.append(datajson_entry)
-            else:
-                logger.warn("Dataset id=[%s], title=[%s] omitted\n", pkg.get('id', None), pkg.get('title', None))
-
-    # Get the error log
-    eh.flush()
-    error = stream.getvalue()
-    eh.close()
-    logger.removeHandler(eh)
-    stream.close()
-
-    #return json.dumps(output)
-    return write_zip(output, error, zip_name='edi')
-
-
-def make_pdl(owner_org):
-    # Error handler for creating error log
-    stream = StringIO.StringIO()
-    eh = logging.StreamHandler(stream)
-    eh.setLevel(logging.WARN)
-    formatter = logging.Formatter('%(asctime)s - %(message)s')
-    eh.setFormatter(formatter)
-    logger.addHandler(eh)
-
-
-    # Build the data.json file.
-    packages = get_all_group_packages(group_id=owner_org)
-
-    output = []
-    #Create data.json only using public datasets, datasets marked non-public are not exposed
-    for pkg in packages:
-        extras = dict([(x['key'], x['value']) for x in pkg['extras']])
-        try:
-            if pkg['owner_org'] == owner_org \
-                    and not (re.match(r'[Nn]on-public', extras['public_access_level'])):
+                    uid = dict([(x['key'], x['value']) for x in pkg_dict['extras']]).get('unique_id')
+                    if uid:
+                        removed.append(uid)
+    finally:
+        renderer.close()
+
+    return entries, removed
+
+
+def make_cached_json():
+    # Build the serialized data.json file for the catalog cache, reusing the entries of packages that haven't changed
+    stats = BuildStats('data.json')
+    verdicts.new_generation()
+    with stats.phase('load'):
+        packages = get_json_packages()
+        parent_identifiers = loader.load_all_parent_identifiers()
+    renderer = PackageRenderer(render_json_entry, DataJsonPlugin.build_processes, parent_identifiers)
+    try:
+        fragments = DataJsonPlugin.entry_cache.render(stats.packages(packages), renderer.render_many,
+                                                      parent_identifiers)
+        for chunk in stats.output(iter_serialized_catalog(stats.entries(fragments))):
+            yield chunk
+    finally:
+        renderer.close()
+
+
+def iter_json_entries(packages, parent_identifiers=None):
+    renderer = PackageRenderer(make_json_entry, DataJsonPlugin.build_processes, parent_identifiers)
+    try:
+        for datajson_entry in renderer.iter_render(packages):
+            if datajson_entry:
+                yield datajson_entry
+    finally:
+        renderer.close()
+
+
+def render_json_entry(pkg, parent_identifiers=None, errors=None):
+    datajson_entry = make_json_entry(pkg, parent_identifiers, errors)
+    if datajson_entry:
+        return json.dumps(datajson_entry)
+
+
+def make_json_entry(pkg, parent_identifiers=None, errors=None):
+    # Create data.json only using public and public-restricted datasets, datasets marked non-public are not exposed.
+    # Reasons for leaving a dataset out are appended to errors.
+    errors = [] if errors is None else errors
+    extras = dict([(x['key'], x['value']) for x in pkg['extras']])
+    if 'public_access_level' not in extras:
+        errors.append(('missing_access_level', "missing required 'public_access_level' field"))
+    elif not (re.match(r'[Nn]on-public', extras['public_access_level'])):
+        datajson_entry = make_datajson_entry(pkg, parent_identifiers, errors)
+        if datajson_entry and check_entry(datajson_entry, errors):
+            return datajson_entry
+
+
+def check_entry(datajson_entry, errors):
+    """
+    Runs an entry through validation at the configured level, appending the reasons it was rejected to errors if it
+    is. Entries get the same verdict whichever catalog they are built for.
+    """
+    valid, messages = validate_entry(datajson_entry, DataJsonPlugin.validation_level)
+    errors.extend(('invalid', message) for message in messages)
+    return valid
 
-                datajson_entry = make_datajson_entry(pkg)
-                if datajson_entry and is_valid(datajson_entry):
-                    output.append(datajson_entry)
-                else:
-                    logger.warn("Dataset id=[%s], title=[%s] omitted\n", pkg.get('id', None), pkg.get('title', None))
 
-        except KeyError:
-            logger.warn("Dataset id=[%s], title=['%s'] missing required 'public_access_level' field",
-                        pkg.get('id', None), pkg.get('title', None))
-            pass
+def release_session(body):
+    """
+    Wraps a streamed response body so the database session opened while it is being generated is cleaned up once the
+    server has finished sending it. CKAN removes the request's session before a streamed body is consumed.
+    """
+    try:
+        for chunk in body:
+            yield chunk
+    finally:
+        model.Session.remove()
 
-    # Get the error log
-    eh.flush()
-    error = stream.getvalue()
-    eh.close()
-    logger.removeHandler(eh)
-    stream.close()
 
-    #return json.dumps(output)
-    return write_zip(output, error, zip_name='pdl')
+def make_edi(owner_org, version=None):
+    return make_listing('edi', owner_org, iter_edi_zip, version)
 
 
-def get_all_group_packages(group_id):
+def iter_edi_zip(owner_org):
+    return iter_organization_zip('edi', owner_org, make_edi_entry)
+
+
+def make_pdl(owner_org, version=None):
+    return make_listing('pdl', owner_org, iter_pdl_zip, version)
+
+
+def iter_pdl_zip(owner_org):
+    return iter_organization_zip('pdl', owner_org, make_pdl_entry)
+
+
+def iter_organization_zip(zip_name, owner_org, render):
+    # Build the data.json file of the organization's own packages, counting and timing the build
+    stats = BuildStats(zip_name)
+    with stats.phase('load'):
+        packages = (pkg for pkg in get_all_group_packages(group_id=owner_org) if pkg['owner_org'] == owner_org)
+    return stats.output(iter_listing_zip(stats.packages(packages), render, stats))
+
+
+def make_listing(zip_name, owner_org, iter_zip, version=None):
+    # Serve the organization's stored archive if there is one, otherwise stream a fresh one. version ties the stored
+    # archive to the organization's packages, so it is rebuilt after any of them changes or moves elsewhere. Archives
+    # are only stored in a cache directory: held in memory, those of every organization ever asked for would pile up
+    # in each web process.
+    cache = DataJsonPlugin.catalog_cache
+    if cache and cache.cache_dir:
+        payload = cache.fetch(listing_cache_name(zip_name, owner_org), lambda: iter_zip(owner_org),
+                              version=version, encodings=[])
+        if payload.stale:
+            forget_validators()
+        response.content_length = payload.size()
+        return write_zip(payload.iter_chunks(), zip_name=zip_name)
+    return write_zip(iter_zip(owner_org), zip_name=zip_name)
+
+
+def forget_validators():
+    # An older copy of the catalog is being sent while a new one is built elsewhere. It must not be cached by clients
+    # under the ETag and Last-Modified of the current catalog.
+    response.etag = None
+    response.last_modified = None
+
+
+def listing_cache_name(zip_name, owner_org):
+    return '%s-%s.zip' % (zip_name, owner_org)
+
+
+def iter_listing_zip(packages, render, stats=None):
     """
-    Gets all of the group packages, public or private, returning them as a list of CKAN's dictized packages.
+    Streams a zip file holding the data.json catalog of the entries render builds for the packages, followed by a
+    log of the datasets that were left out and why. Entries are deflated into the archive as they are built, so
+    memory use doesn't grow with the size of the catalog. The entries are counted in stats, a BuildStats.
     """
-    result = []
-    for pkg_rev in model.Group.get(group_id).packages(with_private=True, context={'user_is_admin': True}):
-        result.append(model_dictize.package_dictize(pkg_rev, {'model': model}))
+    stats = stats or BuildStats()
+    diagnostics = Diagnostics()
+    renderer = PackageRenderer(render, DataJsonPlugin.build_processes, diagnostics=diagnostics)
+    try:
+        zf = ZipStream()
+        entries = stats.entries(datajson_entry for datajson_entry in renderer.iter_render(packages) if datajson_entry)
 
-    return result
+        # Write the data file, if there's anything to put in it
+        first = next(entries, None)
+        if first is not None:
+            for chunk in zf.member('data.json', iter_datajson_catalog(itertools.chain([first], entries),
+                                                                      ensure_ascii=False)):
+                yield chunk
+
+        # Write the error log
+        error = diagnostics.error_log()
+        if error:
+            for chunk in zf.member('errorlog.txt', [encode_if_unicode(error)]):
+                yield chunk
+
+        for chunk in zf.close():
+            yield chunk
+    finally:
+        renderer.close()
+
+
+def make_edi_entry(pkg, parent_identifiers=None, errors=None):
+    errors = [] if errors is None else errors
+    datajson_entry = make_datajson_entry(pkg, parent_identifiers, errors)
+    if datajson_entry and check_entry(datajson_entry, errors):
+        return datajson_entry
+
+
+def make_pdl_entry(pkg, parent_identifiers=None, errors=None):
+    # Create data.json only using public datasets, datasets marked non-public are not exposed
+    return make_json_entry(pkg, parent_identifiers, errors)
+
+
+def get_all_group_packages(group_id):
+    """
+    Gets all of the group packages, public or private, returning them as an iterator of lightweight dictized packages
+    that are loaded a chunk at a time with a handful of queries each (see loader.iter_packages).
+    """
+    group = model.Group.get(group_id)
+    package_ids = [pkg_id for (pkg_id,) in model.Session.query(model.Package.id)
+                   .join(model.Member, model.Member.table_id == model.Package.id)
+                   .filter(model.Member.group_id == group.id)
+                   .filter(model.Member.table_name == 'package')
+                   .filter(model.Member.state == 'active')
+                   .filter(model.Package.state.in_(['active', 'pending']))
+                   .order_by(model.Package.name)]
+    return loader.iter_packages(package_ids)
 
 
 def is_valid(instance):
     """
     Validates a data.json entry against the project open data's JSON schema. Log a warning message on validation error
     """
-    error = best_match(validator.iter_errors(instance))
+    error = schema_error(instance)
     if error:
         logger.warn("Validation failed, best guess of error = %s", error)
         return False
     return True
 
 
-def write_zip(data, error=None, zip_name='data'):
+def write_zip(chunks, zip_name='data'):
     """
-    Data: a python object to write to the data.json
-    Error: unicode string representing the content of the error log.
+    chunks: the byte strings of the zip file, as produced by iter_listing_zip
     zip_name: the name to use for the zip file
     """
-    import zipfile
-
-    o = StringIO.StringIO()
-    zf = zipfile.ZipFile(o, mode='w')
-
-    # Write the data file
-    if data:
-        zf.writestr('data.json', json.dumps(make_datajson_catalog(data), ensure_ascii=False).encode('utf8'))
-
-    #Write the error log
-    if error:
-        zf.writestr('errorlog.txt', error.encode('utf8'))
-
-    zf.close()
-    o.seek(0)
-
-    binary = o.read()
-    o.close()
-
     response.content_type = 'application/octet-stream'
     response.content_disposition = 'attachment; filename="%s.zip"' % zip_name
 
-    return binary
-
+    return release_session(chunks)
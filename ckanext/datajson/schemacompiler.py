@@ -0,0 +1,188 @@
+import numbers
+import re
+import urllib
+import urlparse
+
+from jsonschema._utils import uniq
+
+# Python expressions testing the instance x against each of the JSON schema primitive types, as Draft 4 defines them
+TYPE_CHECKS = {
+    'array': 'isinstance(x, list)',
+    'boolean': 'isinstance(x, bool)',
+    'integer': '(isinstance(x, (int, long)) and not isinstance(x, bool))',
+    'null': 'x is None',
+    'number': '(isinstance(x, numbers.Number) and not isinstance(x, bool))',
+    'object': 'isinstance(x, dict)',
+    'string': 'isinstance(x, basestring)',
+}
+
+# keywords that have no bearing on whether an instance is valid
+ANNOTATIONS = set(['$schema', 'id', 'title', 'description', 'definitions', 'default'])
+
+STRING_KEYWORDS = set(['minLength', 'maxLength', 'pattern'])
+ARRAY_KEYWORDS = set(['items', 'minItems', 'maxItems', 'uniqueItems'])
+OBJECT_KEYWORDS = set(['required', 'properties', 'dependencies'])
+SUPPORTED = ANNOTATIONS | STRING_KEYWORDS | ARRAY_KEYWORDS | OBJECT_KEYWORDS | set(['type', 'enum', 'anyOf', 'format'])
+
+
+def find_documents(schema, base=''):
+    """
+    Maps the URL of each (sub)schema of schema that declares an id to that subschema, the way a jsonschema
+    RefResolver store does. The dataset schema embeds the vcard, distribution and organization schemas it refers to
+    under definitions, so with this store none of them has to be fetched over the network.
+    """
+    documents = {}
+    if isinstance(schema, dict):
+        if isinstance(schema.get('id'), basestring):
+            base = urlparse.urljoin(base, schema['id'])
+            documents[urlparse.urldefrag(base)[0]] = schema
+        for key, value in schema.items():
+            if key != 'enum':
+                documents.update(find_documents(value, base))
+    elif isinstance(schema, list):
+        for item in schema:
+            documents.update(find_documents(item, base))
+    return documents
+
+
+def compile_validator(schema, format_checker=None):
+    """
+    Turns a Draft 4 JSON schema into a Python function that returns whether an instance is valid, without building
+    any error objects. Each subschema becomes a plain function whose checks are written out as Python source once,
+    so validating an instance doesn't walk the schema. Formats are checked with format_checker, as jsonschema would.
+    Raises NotImplementedError for schemas using keywords or references the compiler doesn't handle.
+    """
+    return SchemaCompiler(schema, format_checker).compile()
+
+
+class SchemaCompiler(object):
+    def __init__(self, schema, format_checker=None):
+        self.schema = schema
+        self.format_checker = format_checker
+        self.documents = find_documents(schema)
+        self.names = {}
+        self.trivial = set()
+        self.constants = {}
+        self.source = []
+
+    def compile(self):
+        name = self.function(self.schema, '')
+        namespace = {'numbers': numbers, 'uniq': uniq}
+        namespace.update(self.constants)
+        exec compile('\n'.join(self.source), '<schema %s>' % self.schema.get('id', ''), 'exec') in namespace
+        return namespace[name]
+
+    def function(self, schema, base):
+        """
+        Writes out the validating function of a subschema, unless it already has one, and returns its name.
+        """
+        if id(schema) in self.names:
+            return self.names[id(schema)]
+        # name the function before compiling the subschema's own subschemas, so that it can refer to itself
+        name = 'validate_%d' % len(self.names)
+        self.names[id(schema)] = name
+
+        if isinstance(schema.get('id'), basestring):
+            base = urlparse.urljoin(base, schema['id'])
+        lines = self.checks(schema, base)
+        if not lines:
+            self.trivial.add(name)
+        self.source.append('def %s(x):' % name)
+        self.source.extend('    ' + line for line in lines)
+        self.source.append('    return True')
+        return name
+
+    def constant(self, value):
+        name = 'c_%d' % len(self.constants)
+        self.constants[name] = value
+        return name
+
+    def resolve(self, ref, base):
+        url, fragment = urlparse.urldefrag(urlparse.urljoin(base, ref))
+        if url not in self.documents:
+            raise NotImplementedError('Unable to resolve $ref %s' % ref)
+        schema = self.documents[url]
+        for part in fragment.split('/')[1:]:
+            part = urllib.unquote(part).replace('~1', '/').replace('~0', '~')
+            schema = schema[int(part)] if isinstance(schema, list) else schema[part]
+        return schema, url
+
+    def checks(self, schema, base):
+        # as in jsonschema, any other keywords next to a $ref are ignored
+        if '$ref' in schema:
+            target, url = self.resolve(schema['$ref'], base)
+            return ['return %s(x)' % self.function(target, url)]
+
+        unsupported = set(schema) - SUPPORTED
+        if unsupported:
+            raise NotImplementedError('Unsupported schema keywords: %s' % ', '.join(sorted(unsupported)))
+
+        lines = []
+        if 'type' in schema:
+            types = schema['type'] if isinstance(schema['type'], list) else [schema['type']]
+            lines.append('if not (%s): return False' % ' or '.join(TYPE_CHECKS[t] for t in types))
+        if 'enum' in schema:
+            lines.append('if x not in %s: return False' % self.constant(schema['enum']))
+        if 'anyOf' in schema:
+            names = [self.function(subschema, base) for subschema in schema['anyOf']]
+            if not self.trivial.intersection(names):
+                lines.append('if not (%s): return False' % ' or '.join('%s(x)' % name for name in names))
+        if 'format' in schema and self.format_checker is not None:
+            lines.append('if not %s(x, %r): return False' % (self.constant(self.format_checker.conforms),
+                                                             schema['format']))
+
+        lines.extend(self.guarded('isinstance(x, basestring)', self.string_checks(schema)))
+        lines.extend(self.guarded('isinstance(x, list)', self.array_checks(schema, base)))
+        lines.extend(self.guarded('isinstance(x, dict)', self.object_checks(schema, base)))
+        return lines
+
+    def guarded(self, condition, lines):
+        if not lines:
+            return []
+        return ['if %s:' % condition] + ['    ' + line for line in lines]
+
+    def string_checks(self, schema):
+        lines = []
+        if 'minLength' in schema:
+            lines.append('if len(x) < %d: return False' % schema['minLength'])
+        if 'maxLength' in schema:
+            lines.append('if len(x) > %d: return False' % schema['maxLength'])
+        if 'pattern' in schema:
+            lines.append('if not %s(x): return False' % self.constant(re.compile(schema['pattern']).search))
+        return lines
+
+    def array_checks(self, schema, base):
+        lines = []
+        if 'minItems' in schema:
+            lines.append('if len(x) < %d: return False' % schema['minItems'])
+        if 'maxItems' in schema:
+            lines.append('if len(x) > %d: return False' % schema['maxItems'])
+        if schema.get('uniqueItems'):
+            lines.append('if not uniq(x): return False')
+        if 'items' in schema:
+            if not isinstance(schema['items'], dict):
+                raise NotImplementedError('Only a single schema is supported for items')
+            name = self.function(schema['items'], base)
+            if name not in self.trivial:
+                lines.append('for item in x:')
+                lines.append('    if not %s(item): return False' % name)
+        return lines
+
+    def object_checks(self, schema, base):
+        lines = []
+        for key in schema.get('required', []):
+            lines.append('if %r not in x: return False' % key)
+        for key, subschema in sorted(schema.get('properties', {}).items()):
+            name = self.function(subschema, base)
+            if name not in self.trivial:
+                lines.append('if %r in x and not %s(x[%r]): return False' % (key, name, key))
+        for key, dependency in sorted(schema.get('dependencies', {}).items()):
+            if isinstance(dependency, dict):
+                name = self.function(dependency, base)
+                if name not in self.trivial:
+                    lines.append('if %r in x and not %s(x): return False' % (key, name))
+            else:
+                dependency = dependency if isinstance(dependency, list) else [dependency]
+                for required in dependency:
+                    lines.append('if %r in x and %r not in x: return False' % (key, required))
+        return lines
@@ -0,0 +1,165 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+log = logging.getLogger('datajson')
+
+# where the time of a catalog build goes: loading packages from the database, building the entries, validating them,
+# and serializing (and zipping) the output
+PHASES = ('load', 'render', 'validate', 'serialize')
+
+# the build whose phases are being timed on this thread, so code deep in the builders can time itself
+active = threading.local()
+
+
+class BuildStats(object):
+    """
+    Times the phases of one catalog build and counts what went through it: the packages seen, the entries emitted,
+    the packages omitted (by reason) and the bytes written. Phases don't overlap: time spent validating in the middle
+    of rendering an entry only counts as validation. When entries are rendered by worker processes, their validation
+    time is part of the render phase.
+    """
+
+    def __init__(self, catalog=None):
+        self.catalog = catalog
+        self.started = time.time()
+        self.elapsed = None
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.seen = 0
+        self.emitted = 0
+        self.omitted = {}
+        self.bytes = 0
+        self._stack = []
+        self._mark = None
+
+    @contextmanager
+    def phase(self, name):
+        now = time.time()
+        if self._stack:
+            self.phases[self._stack[-1]] += now - self._mark
+        self._stack.append(name)
+        self._mark = now
+        previous, active.stats = getattr(active, 'stats', None), self
+        try:
+            yield
+        finally:
+            active.stats = previous
+            now = time.time()
+            self.phases[self._stack.pop()] += now - self._mark
+            self._mark = now
+
+    def omit(self, reason):
+        self.omitted[reason] = self.omitted.get(reason, 0) + 1
+
+    def packages(self, packages):
+        """
+        Yields the packages of an iterable, counting them and timing their loading.
+        """
+        packages = iter(packages)
+        while True:
+            with self.phase('load'):
+                pkg = next(packages, None)
+            if pkg is None:
+                break
+            self.seen += 1
+            yield pkg
+
+    def entries(self, entries):
+        """
+        Yields the entries of an iterable, counting them.
+        """
+        for entry in entries:
+            self.emitted += 1
+            yield entry
+
+    def output(self, chunks):
+        """
+        Yields the byte strings of the built catalog, timing their production as serialization (apart from any other
+        phase it sets off) and counting their bytes. The build is finished once they run out or the caller stops.
+        """
+        chunks = iter(chunks)
+        try:
+            while True:
+                with self.phase('serialize'):
+                    chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                self.bytes += len(chunk)
+                yield chunk
+        finally:
+            self.finish()
+
+    def finish(self):
+        if self.elapsed is not None:
+            return
+        self.elapsed = time.time() - self.started
+        metrics.record(self)
+        log.info(self.summary())
+
+    def summary(self):
+        omitted = sum(self.omitted.values())
+        return "Built %s: %d packages seen, %d emitted, %d omitted%s, %d bytes in %.2fs (%s)" % (
+            self.catalog, self.seen, self.emitted, omitted,
+            ' (%s)' % ', '.join('%s=%d' % item for item in sorted(self.omitted.items())) if omitted else '',
+            self.bytes, self.elapsed, ', '.join('%s %.2fs' % (name, self.phases[name]) for name in PHASES))
+
+
+def current():
+    """
+    Returns the BuildStats of the build active on this thread, or None.
+    """
+    return getattr(active, 'stats', None)
+
+
+@contextmanager
+def phase(name):
+    """
+    Times a phase of the build active on this thread, if there is one.
+    """
+    stats = current()
+    if stats is None:
+        yield
+    else:
+        with stats.phase(name):
+            yield
+
+
+class Metrics(object):
+    """
+    Running totals of the catalog builds made by this process, by catalog, in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    def record(self, stats):
+        catalog = stats.catalog or 'other'
+        with self._lock:
+            self._add('datajson_builds_total', {'catalog': catalog}, 1)
+            self._add('datajson_packages_seen_total', {'catalog': catalog}, stats.seen)
+            self._add('datajson_entries_emitted_total', {'catalog': catalog}, stats.emitted)
+            for reason, count in stats.omitted.items():
+                self._add('datajson_packages_omitted_total', {'catalog': catalog, 'reason': reason}, count)
+            self._add('datajson_bytes_written_total', {'catalog': catalog}, stats.bytes)
+            self._add('datajson_build_seconds_total', {'catalog': catalog}, stats.elapsed)
+            for name, seconds in stats.phases.items():
+                self._add('datajson_phase_seconds_total', {'catalog': catalog, 'phase': name}, seconds)
+
+    def _add(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def render(self):
+        with self._lock:
+            counters = sorted(self._counters.items())
+        lines = []
+        for (name, labels), value in counters:
+            if not lines or not lines[-1].startswith(name + '{'):
+                lines.append('# TYPE %s counter' % name)
+            lines.append('%s{%s} %s' % (name, ','.join('%s="%s"' % label for label in labels), value))
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import logging
+import os
+
+from jsonschema import Draft4Validator, FormatChecker, RefResolver
+from jsonschema.exceptions import best_match
+
+from schemacompiler import compile_validator, find_documents
+import stats
+
+log = logging.getLogger('datajson')
+
+# off: entries aren't validated at all
+# fast: entries are checked against the JSON schema only, with the compiled validator
+# full: entries go through the checks of datajsonvalidator.do_validation, then the JSON schema
+LEVELS = ('off', 'fast', 'full')
+
+# how many verdicts a generation of the cache holds before a new one is started, should a process make that many
+# without building the full catalog (which starts a new generation itself)
+MAX_VERDICTS = 1000000
+
+
+def get_validator():
+    schema_path = os.path.join(os.path.dirname(__file__), 'schema', 'federal-v1.1', 'dataset.json')
+    with open(schema_path, 'r') as file:
+        schema = json.loads(file.read())
+        # resolve the $refs to the vcard, distribution and organization schemas embedded in the dataset schema
+        resolver = RefResolver.from_schema(schema, store=find_documents(schema))
+        return Draft4Validator(schema, resolver=resolver, format_checker=FormatChecker())
+
+    log.warn('Unable to create validator')
+    return None
+
+
+def get_fast_validator(validator):
+    """
+    Compiles the schema of validator into a function that only tells whether an entry is valid. Falls back on
+    validator.is_valid if the schema can't be compiled.
+    """
+    try:
+        return compile_validator(validator.schema, validator.format_checker)
+    except NotImplementedError as e:
+        log.warn('Unable to compile the data.json schema, using the jsonschema validator only: %s', e)
+        return validator.is_valid
+
+
+validator = get_validator()
+fast_validator = get_fast_validator(validator)
+
+
+class VerdictCache(object):
+    """
+    Remembers the outcome of validating each entry, keyed by a hash of the entry's content, so an entry that is built
+    again unchanged (on the next /data.json request, or for an organization's PDL and EDI) isn't validated again.
+    Verdicts are kept in two generations: the current one, and the one before it, whose verdicts move to the current
+    one as they are used. Each full build of the catalog starts a new generation (see new_generation), so all of the
+    verdicts of one build are at hand for the next, however large the catalog, and those of datasets that have
+    changed or gone are dropped a build later. Catalog worker processes keep caches of their own, which follow the
+    generations of the web process's cache (see follow).
+    """
+
+    def __init__(self, max_size=MAX_VERDICTS):
+        self.max_size = max_size
+        # counts the calls to new_generation, for worker processes to tell when a build has started
+        self.generation = 0
+        self._verdicts = {}
+        self._previous = {}
+
+    def get(self, key):
+        verdict = self._verdicts.get(key)
+        if verdict is None:
+            verdict = self._previous.get(key)
+            if verdict is not None:
+                self._store(key, verdict)
+        return verdict
+
+    def put(self, key, verdict):
+        self._store(key, verdict)
+
+    def new_generation(self):
+        self.generation += 1
+        self._rotate()
+
+    def follow(self, generation):
+        """
+        Catches up with generation, the generation of another process's cache: a new generation is started if that
+        one has moved on by one, and everything is forgotten if it has moved on by more, since the verdicts held then
+        are from builds before the last one.
+        """
+        if generation == self.generation:
+            return
+        if generation == self.generation + 1:
+            self._rotate()
+        else:
+            self._verdicts, self._previous = {}, {}
+        self.generation = generation
+
+    def _rotate(self):
+        self._previous, self._verdicts = self._verdicts, {}
+
+    def _store(self, key, verdict):
+        if len(self._verdicts) >= self.max_size:
+            self._rotate()
+        self._verdicts[key] = verdict
+
+
+verdicts = VerdictCache()
+
+
+def validate_entry(entry, level='full'):
+    """
+    Validates a data.json entry at one of the LEVELS. Returns whether the entry is valid, and the messages explaining
+    why it isn't. The verdict is remembered, so validating the same entry again costs a hash of its content.
+    """
+    if level == 'off':
+        return True, []
+
+    with stats.phase('validate'):
+        key = '%s:%s' % (level, hashlib.sha1(json.dumps(entry, sort_keys=True)).hexdigest())
+        verdict = verdicts.get(key)
+        if verdict is None:
+            verdict = check_entry(entry, level)
+            verdicts.put(key, verdict)
+        return verdict
+
+
+def check_entry(entry, level):
+    if level == 'full':
+        from datajsonvalidator import do_validation
+        errors = []
+        try:
+            do_validation([dict(entry)], errors)
+        except Exception as e:
+            errors.append(("Internal Error", ["Something bad happened: " + unicode(e)]))
+        if errors:
+            return False, [str(error) for error in errors]
+
+    error = schema_error(entry)
+    if error:
+        # keep the message short: the full text of a jsonschema error quotes the whole schema, which is too much to
+        # hold for every invalid entry
+        location = '/'.join(unicode(part) for part in error.absolute_path)
+        return False, [u"Validation failed, best guess of error = %s%s" % (error.message,
+                                                                           u" at " + location if location else u"")]
+    return True, []
+
+
+def schema_error(instance):
+    """
+    Checks an entry against the project open data's JSON schema. Returns the error that best explains why the entry is
+    invalid, or None if it is valid.
+    """
+    # the compiled validator settles valid entries quickly; only failures are walked again to describe the error
+    if fast_validator(instance):
+        return None
+    return best_match(validator.iter_errors(instance))
@@ -0,0 +1,82 @@
+import struct
+import time
+import zlib
+
+LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+DATA_DESCRIPTOR = struct.Struct('<IIII')
+CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+END_OF_CENTRAL_DIRECTORY = struct.Struct('<IHHHHIIH')
+
+# general purpose flag telling readers the sizes and crc follow the member's data
+FLAG_DATA_DESCRIPTOR = 0x08
+DEFLATED = 8
+VERSION = 20
+
+
+class ZipStream(object):
+    """
+    Writes a zip archive as a sequence of byte strings, without ever holding a whole member in memory or needing a
+    seekable file. Members are deflated as their data comes in, and their sizes and checksums are written after the
+    data, as allowed by the zip format. Archives are limited to 4GB as zip64 isn't supported.
+
+        zf = ZipStream()
+        for chunk in zf.member('data.json', chunks): ...
+        for chunk in zf.close(): ...
+    """
+
+    def __init__(self, compresslevel=6):
+        self.compresslevel = compresslevel
+        self.offset = 0
+        self.members = []
+
+    def member(self, name, chunks):
+        """
+        Yields the bytes of an archive member named name holding the given byte strings.
+        """
+        name = name.encode('utf8') if isinstance(name, unicode) else name
+        dos_time, dos_date = dos_timestamp(time.localtime())
+        header_offset = self.offset
+
+        yield self._count(LOCAL_HEADER.pack(0x04034b50, VERSION, FLAG_DATA_DESCRIPTOR, DEFLATED, dos_time, dos_date,
+                                            0, 0, 0, len(name), 0) + name)
+
+        # negative wbits makes zlib write a raw deflate stream, without the zlib header and trailer
+        compressor = zlib.compressobj(self.compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS)
+        crc = 0
+        size = 0
+        compressed_size = 0
+        for chunk in chunks:
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            data = compressor.compress(chunk)
+            if data:
+                compressed_size += len(data)
+                yield self._count(data)
+        data = compressor.flush()
+        compressed_size += len(data)
+        crc &= 0xffffffff
+
+        yield self._count(data + DATA_DESCRIPTOR.pack(0x08074b50, crc, compressed_size, size))
+        self.members.append((name, dos_time, dos_date, crc, compressed_size, size, header_offset))
+
+    def close(self):
+        """
+        Yields the central directory that ends the archive.
+        """
+        directory = []
+        for name, dos_time, dos_date, crc, compressed_size, size, header_offset in self.members:
+            directory.append(CENTRAL_HEADER.pack(0x02014b50, VERSION, VERSION, FLAG_DATA_DESCRIPTOR, DEFLATED,
+                                                 dos_time, dos_date, crc, compressed_size, size, len(name), 0, 0, 0,
+                                                 0, 0644 << 16, header_offset) + name)
+        directory = ''.join(directory)
+        yield directory + END_OF_CENTRAL_DIRECTORY.pack(0x06054b50, 0, 0, len(self.members), len(self.members),
+                                                        len(directory), self.offset, 0)
+
+    def _count(self, data):
+        self.offset += len(data)
+        return data
+
+
+def dos_timestamp(t):
+    return (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2), \
+           ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
@@ -15,7 +15,7 @@ setup(
     author_email='',
     url='http://www.healthdata.gov',
     license='Public Domain',
-    packages=find_packages(exclude=['ez_setup', 'examples', 'tests']),
+    packages=find_packages(exclude=['ez_setup', 'examples', 'tests', 'benchmarks']),
     namespace_packages=['ckanext', 'ckanext.datajson'],
     include_package_data=True,
     zip_safe=False,
@@ -28,5 +28,8 @@ setup(
         datajson=ckanext.datajson:DataJsonPlugin
         datajson_harvest=ckanext.datajson.harvester_datajson:DataJsonHarvester
         cmsdatanav_harvest=ckanext.datajson:CmsDataNavigatorHarvester
+
+            [paste.paster_command]
+        datajson=ckanext.datajson.commands:DataJsonCommand
         """,
 )